@@ -0,0 +1,146 @@
+"""
+Checks that QuConversionResolver agrees with Grocy's quantity_unit_conversions_resolved view.
+
+Without arguments the resolver is checked against a small fixture with default, product specific (overriding and
+additional) and transitive conversions. With --db the raw tables of a copy of a Grocy database are resolved and
+compared with the view of the same database, the differences are reported per kind of conversion:
+
+    python -m benchmarks.conversion_resolver
+    python -m benchmarks.conversion_resolver --db /tmp/grocy.db
+"""
+import argparse
+import asyncio
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from grocy.api.grocy_sqlite import GrocySQLiteReader
+from grocy.conversion_resolver import QuConversionResolver
+
+PIECE, PACK, GRAM, KILOGRAM, LITER = 1, 2, 3, 4, 5
+
+FIXTURE_QUS = [{"id": qu_id, "name": name, "name_plural": name + "s"} for qu_id, name in
+               [(PIECE, "Piece"), (PACK, "Pack"), (GRAM, "Gram"), (KILOGRAM, "Kilogram"), (LITER, "Liter")]]
+
+FIXTURE_PRODUCTS = [
+    # Only default conversions
+    {"id": 1, "qu_id_stock": GRAM},
+    # A product specific conversion that makes the default conversions of both units reachable
+    {"id": 2, "qu_id_stock": PIECE},
+    # A product specific conversion that overrides a default conversion
+    {"id": 3, "qu_id_stock": PACK},
+]
+
+FIXTURE_CONVERSIONS = [
+    {"product_id": None, "from_qu_id": KILOGRAM, "to_qu_id": GRAM, "factor": 1000.0},
+    {"product_id": None, "from_qu_id": GRAM, "to_qu_id": KILOGRAM, "factor": 0.001},
+    {"product_id": None, "from_qu_id": PACK, "to_qu_id": PIECE, "factor": 6.0},
+    {"product_id": None, "from_qu_id": PIECE, "to_qu_id": PACK, "factor": 1 / 6},
+    {"product_id": 2, "from_qu_id": PIECE, "to_qu_id": GRAM, "factor": 50.0},
+    {"product_id": 2, "from_qu_id": GRAM, "to_qu_id": PIECE, "factor": 0.02},
+    {"product_id": 3, "from_qu_id": PACK, "to_qu_id": PIECE, "factor": 10.0},
+    {"product_id": 3, "from_qu_id": PIECE, "to_qu_id": PACK, "factor": 0.1},
+]
+
+# The rows of the view for the fixture as (product_id, from_qu_id, to_qu_id): factor
+FIXTURE_RESOLVED = {
+    (1, GRAM, GRAM): 1.0,
+    (1, KILOGRAM, GRAM): 1000.0,
+    (1, GRAM, KILOGRAM): 0.001,
+    (2, PIECE, PIECE): 1.0,
+    (2, PIECE, GRAM): 50.0,
+    (2, GRAM, PIECE): 0.02,
+    (2, PACK, PIECE): 6.0,
+    (2, PIECE, PACK): 1 / 6,
+    (2, PIECE, KILOGRAM): 0.05,
+    (2, KILOGRAM, PIECE): 20.0,
+    (2, PACK, GRAM): 300.0,
+    (2, GRAM, PACK): 0.02 / 6,
+    (2, PACK, KILOGRAM): 0.3,
+    (2, KILOGRAM, PACK): 20 / 6,
+    (3, PACK, PACK): 1.0,
+    (3, PACK, PIECE): 10.0,
+    (3, PIECE, PACK): 0.1,
+}
+
+
+def get_pairs(rows) -> dict[tuple[int, int, int], float]:
+    return {(row["product_id"], row["from_qu_id"], row["to_qu_id"]): float(row["factor"]) for row in rows}
+
+
+def get_kind(pair: tuple[int, int, int], direct_conversions: dict[tuple[int, int], set]) -> str:
+    product_id, from_qu_id, to_qu_id = pair
+    if from_qu_id == to_qu_id:
+        return "identity"
+    direct = direct_conversions.get((from_qu_id, to_qu_id), set())
+    if product_id in direct:
+        return "product specific"
+    if None in direct:
+        return "default"
+    return "transitive"
+
+
+def compare(expected: dict, resolved: dict, conversions) -> bool:
+    """
+    Print the pairs missing in, added by and resolved to another factor by the resolver, grouped by kind.
+    :return: whether both agree
+    """
+    direct_conversions = {}
+    for conversion in conversions:
+        direct_conversions.setdefault((conversion["from_qu_id"], conversion["to_qu_id"]), set()).add(
+            conversion["product_id"])
+    differences = {}
+    for pair in expected.keys() | resolved.keys():
+        if pair not in resolved:
+            difference = "missing"
+        elif pair not in expected:
+            difference = "extra"
+        elif not math.isclose(expected[pair], resolved[pair], rel_tol=1e-9):
+            difference = "factor"
+        else:
+            continue
+        differences.setdefault((get_kind(pair, direct_conversions), difference), []).append(pair)
+    kinds = {}
+    for pair in expected:
+        kind = get_kind(pair, direct_conversions)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"{'kind':<20}{'view':>10}{'missing':>10}{'extra':>10}{'factor':>10}")
+    for kind in ["identity", "default", "product specific", "transitive"]:
+        counts = [len(differences.get((kind, difference), [])) for difference in ["missing", "extra", "factor"]]
+        print(f"{kind:<20}{kinds.get(kind, 0):>10}" + "".join(f"{count:>10}" for count in counts))
+    for (kind, difference), pairs in sorted(differences.items()):
+        for pair in sorted(pairs)[:10]:
+            print(f"{difference} {kind} {pair}: view {expected.get(pair)}, resolver {resolved.get(pair)}")
+    return len(differences) == 0
+
+
+def check_fixture() -> bool:
+    resolved = QuConversionResolver().resolve(FIXTURE_PRODUCTS, FIXTURE_QUS, FIXTURE_CONVERSIONS)
+    return compare(FIXTURE_RESOLVED, get_pairs(resolved), FIXTURE_CONVERSIONS)
+
+
+async def check_db(db_path: str) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never read the live database of a running Grocy instance
+        db_copy = os.path.join(tmp, "grocy.db")
+        shutil.copyfile(db_path, db_copy)
+        reader = GrocySQLiteReader(db_copy)
+        products, qus, conversions, view = await asyncio.gather(reader.get_products(), reader.get_qus(),
+                                                                reader.get_qu_conversions(),
+                                                                reader.get_qu_conversions_resolved())
+    start = time.perf_counter()
+    resolved = QuConversionResolver().resolve(products, qus, conversions)
+    print(f"Resolved {len(resolved)} conversions in {time.perf_counter() - start:.4f}s, the view has {len(view)}.")
+    return compare(get_pairs(view), get_pairs(resolved), conversions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="path to a copy of a grocy.db, compared with its resolved view")
+    args = parser.parse_args()
+    agree = asyncio.run(check_db(args.db)) if args.db is not None else check_fixture()
+    print("The resolver agrees with the view." if agree else "The resolver differs from the view.")
+    sys.exit(0 if agree else 1)
@@ -0,0 +1,78 @@
+"""
+Compares recall and latency of the lemma based whoosh product search with the trigram fuzzy matcher on receipt
+style product names, using the existing product index in index/products.
+
+Labeled receipt lines can be given as a JSON lines file with "text" and "product_id" per line. Without it, queries
+are generated from the indexed German names the way receipts abbreviate them: upper case, words truncated and the
+name cut after a few words.
+
+    python -m benchmarks.fuzzy_matching --labeled receipt_lines.jsonl
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from grocy.index import GrocyIndex
+
+
+def abbreviate(name: str, rng: random.Random) -> str:
+    words = name.split()[:3]
+    words = [word[:rng.randint(4, 7)] + "." if len(word) > 7 else word for word in words]
+    return " ".join(words).upper()
+
+
+def get_synthetic_queries(grocy_index: GrocyIndex, count: int, seed: int) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    documents = [document for document in grocy_index.product_index.get_stored_documents() if document.get("name_de")]
+    documents = rng.sample(documents, min(count, len(documents)))
+    return [(abbreviate(document["name_de"], rng), document["id"]) for document in documents]
+
+
+def get_labeled_queries(path: str) -> list[tuple[str, str]]:
+    with open(path, "r", encoding="utf-8") as fp:
+        lines = [json.loads(line) for line in fp if line.strip() != ""]
+    return [(line["text"], str(line["product_id"])) for line in lines]
+
+
+def measure(name: str, search, queries: list[tuple[str, str]], k: int):
+    latencies = []
+    hits_1 = 0
+    hits_k = 0
+    for text, product_id in queries:
+        start = time.perf_counter()
+        results = search(text, k)
+        latencies.append(time.perf_counter() - start)
+        ids = [str(result['id']) for result in results]
+        hits_1 += ids[:1] == [product_id]
+        hits_k += product_id in ids
+    latencies.sort()
+    print(f"{name:<10}{hits_1 / len(queries):>10.3f}{hits_k / len(queries):>10.3f}"
+          f"{statistics.median(latencies) * 1000:>10.3f}{latencies[int(len(latencies) * 0.95)] * 1000:>10.3f}")
+
+
+def main(labeled: str | None, count: int, k: int, seed: int):
+    grocy_index = GrocyIndex(grocy_mirror=None)
+    queries = get_labeled_queries(labeled) if labeled is not None else get_synthetic_queries(grocy_index, count, seed)
+    if len(queries) == 0:
+        raise Exception("No queries, index the products first or give labeled receipt lines.")
+    # Build the trigram index before measuring
+    grocy_index.query_product_fuzzy("")
+    whoosh_index = grocy_index.product_index
+    # Query the whoosh index without the result cache, every query is distinct in a real receipt stream
+    whoosh_index.cache_size = 0
+    print(f"{len(queries)} queries")
+    print(f"{'matcher':<10}{'recall@1':>10}{f'recall@{k}':>10}{'p50 [ms]':>10}{'p95 [ms]':>10}")
+    measure("whoosh", lambda text, limit: whoosh_index.search(text, limit=limit), queries, k)
+    measure("trigram", lambda text, limit: grocy_index.query_product_fuzzy(text, limit=limit), queries, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labeled", help="JSON lines file with text and product_id of receipt lines")
+    parser.add_argument("--count", type=int, default=500, help="number of generated queries")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.labeled, args.count, args.k, args.seed)
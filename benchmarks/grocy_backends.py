@@ -0,0 +1,65 @@
+"""
+Compares the bulk reads of the Grocy REST API with direct reads from the Grocy SQLite database.
+
+Run from the repository root with config.yml pointing to the Grocy instance and --db pointing to a copy of its
+database, e.g.:
+
+    python -m benchmarks.grocy_backends --db /tmp/grocy.db --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import yaml
+from aiohttp import ClientSession
+
+from containers import get_base_url
+from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_sqlite import GrocySQLiteReader
+
+READS = ["get_products", "get_qus", "get_qu_conversions", "get_qu_conversions_resolved", "get_barcodes",
+         "get_stores", "get_userfields", "get_shopping_list", "get_stock_log"]
+
+
+async def measure(backend, method: str, repeat: int):
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(await getattr(backend, method)())
+        timings.append(time.perf_counter() - start)
+    return rows, statistics.median(timings)
+
+
+async def main(config_path: str, db_path: str, repeat: int):
+    with open(config_path, "r") as fp:
+        config = yaml.safe_load(fp)["grocy"]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Never read the live database of a running Grocy instance
+        db_copy = os.path.join(tmp, "grocy.db")
+        shutil.copyfile(db_path, db_copy)
+        sqlite_reader = GrocySQLiteReader(db_copy)
+        async with ClientSession(base_url=get_base_url(config["host"], config["port"]),
+                                 headers={"accept": "application/json", "Content-Type": "application/json",
+                                          "GROCY-API-KEY": config["api_key"]}) as session:
+            grocy_api = GrocyAPI(session, json_backend=config.get("json_backend"))
+            print(f"{'method':<32}{'rows':>10}{'rest [s]':>12}{'sqlite [s]':>12}{'speedup':>10}")
+            for method in READS:
+                rest_rows, rest_time = await measure(grocy_api, method, repeat)
+                sqlite_rows, sqlite_time = await measure(sqlite_reader, method, repeat)
+                rows = str(rest_rows) if rest_rows == sqlite_rows else f"{rest_rows}/{sqlite_rows}"
+                print(f"{method:<32}{rows:>10}{rest_time:>12.4f}{sqlite_time:>12.4f}"
+                      f"{rest_time / max(sqlite_time, 1e-9):>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="config.yml")
+    parser.add_argument("--db", required=True, help="path to a copy of the grocy.db of the configured instance")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.config, args.db, args.repeat))
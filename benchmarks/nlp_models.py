@@ -0,0 +1,60 @@
+"""
+Compares startup time and resident memory of the spaCy models used by GrocyIndex and OfferIndex, loaded once per
+tokenizer with the full pipeline (separate) and through the shared model registry (shared).
+
+Every mode runs in its own process:
+
+    python -m benchmarks.nlp_models
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+# The tokenizers created by GrocyIndex (en, de) and OfferIndex (de)
+LANGUAGES = ["en", "de", "de"]
+QUERY = "Vollmilch 3,5% Fett"
+
+
+def get_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode: str):
+    rss_start = get_rss_mb()
+    start = time.perf_counter()
+    if mode == "separate":
+        import spacy
+        from utils.nlp import MODELS
+        models = [spacy.load(MODELS.get(lang, MODELS["en"])) for lang in LANGUAGES]
+    else:
+        from utils.whoosh.tokenizers import LemmaTokenizer
+        models = [LemmaTokenizer(lang).nlp for lang in LANGUAGES]
+    loaded = time.perf_counter() - start
+    for nlp in models:
+        nlp(QUERY)
+    print(json.dumps({"mode": mode, "load_seconds": loaded, "first_query_seconds": time.perf_counter() - start - loaded,
+                      "distinct_models": len({id(nlp) for nlp in models}), "rss_mb": get_rss_mb() - rss_start}))
+
+
+def main():
+    print(f"{'mode':<10}{'models':>8}{'load [s]':>10}{'query [s]':>11}{'rss [MB]':>10}")
+    for mode in ["separate", "shared"]:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.nlp_models", "--mode", mode], check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['distinct_models']:>8}{result['load_seconds']:>10.2f}"
+              f"{result['first_query_seconds']:>11.3f}{result['rss_mb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["separate", "shared"])
+    args = parser.parse_args()
+    if args.mode is None:
+        main()
+    else:
+        run(args.mode)
@@ -0,0 +1,84 @@
+"""
+Compares the whoosh and the SQLite FTS5 search backend on the products of the existing product index in
+index/products: indexing throughput, query latency and how often both backends return the same best match.
+
+The product documents are lemmatized once up front and then indexed into a fresh index of every backend in a
+temporary directory, so only the work of the backend is measured. Queries are product names and their first words
+in all languages, the result cache is disabled.
+
+    python -m benchmarks.search_backends --count 500
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from whoosh.qparser import OrGroup
+
+from grocy.index import GrocyIndex
+from utils.search.backends import create_search_index
+from utils.whoosh.lemmatizer import lemmatize_documents
+
+FIELDS = ["name_en", "name_de", "name_mk", "description"]
+
+
+def get_queries(documents: list[dict], count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    texts = [document[field] for document in documents for field in ["name_en", "name_de", "name_mk"]
+             if document.get(field)]
+    texts = rng.sample(texts, min(count, len(texts)))
+    return texts + [text.split()[0] for text in texts]
+
+
+def measure(backend: str, grocy_index: GrocyIndex, documents: list[dict], queries: list[str], k: int):
+    search_index = create_search_index(backend, "products", grocy_index.product_schema, FIELDS, group=OrGroup)
+    search_index.cache_size = 0
+    start = time.perf_counter()
+    search_index.replace([dict(document) for document in documents])
+    indexing = time.perf_counter() - start
+    latencies = []
+    results = []
+    for text in queries:
+        start = time.perf_counter()
+        results.append([str(result['id']) for result in search_index.search(text, limit=k)])
+        latencies.append(time.perf_counter() - start)
+    search_index.close()
+    latencies.sort()
+    print(f"{backend:<8}{len(documents) / indexing:>12.0f}{statistics.median(latencies) * 1000:>10.3f}"
+          f"{latencies[int(len(latencies) * 0.95)] * 1000:>10.3f}")
+    return results
+
+
+def main(count: int, k: int, seed: int):
+    grocy_index = GrocyIndex(grocy_mirror=None)
+    documents = grocy_index.product_index.get_stored_documents()
+    if len(documents) == 0:
+        raise Exception("No products, index the products first.")
+    queries = get_queries(documents, count, seed)
+    lemmatize_documents(documents, grocy_index.product_lemmatizers)
+    print(f"{len(documents)} documents, {len(queries)} queries")
+    print(f"{'backend':<8}{'docs/s':>12}{'p50 [ms]':>10}{'p95 [ms]':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        # The backends create their indexes below index/ of the working directory
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            whoosh_results = measure("whoosh", grocy_index, documents, queries, k)
+            fts5_results = measure("fts5", grocy_index, documents, queries, k)
+        finally:
+            os.chdir(cwd)
+    found = [(a, b) for a, b in zip(whoosh_results, fts5_results) if len(a) > 0 or len(b) > 0]
+    top_1 = sum(a[:1] == b[:1] for a, b in found) / max(len(found), 1)
+    top_k = statistics.mean(len(set(a) & set(b)) / len(set(a) | set(b)) for a, b in found) if found else 0.0
+    print(f"{len(found)} queries with results, top-1 agreement {top_1:.3f}, mean top-{k} overlap {top_k:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500, help="number of sampled product names")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.count, args.k, args.seed)
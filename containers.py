@@ -12,6 +12,10 @@ from starlette.templating import Jinja2Templates
 
 from grocy import GrocyProductUpdateHandlerComposite
 from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
+from grocy.api.grocy_sqlite import GrocySQLiteReader
+from grocy.api.write_queue import GrocyWriteQueue
+from grocy.conversion_resolver import QuConversionResolver
 from grocy.index import GrocyIndex
 from grocy.product_data_update import GrocyDataUpdateProductAndBarcodeHandler
 from integrations.offers import GrocyOfferIntegration, GrocyQuOfferFilter
@@ -19,6 +23,8 @@ from klupps import KluppsGrocyProductNameUpdateHandler
 from offers.index import OfferIndex
 from offers.markt_guru import MarktGuruAPI, MarktGuruOffersService
 from offers.services import CompositeOffersService
+from offers.snapshots import OfferSnapshotStore
+from offers.workers import OfferRefreshWorker
 from products.data.model import ProductDataSource, CompositeProductDataSource
 from products.data.off import OFFProductDataSource
 from products.quantity import Quantity, QuantityParser
@@ -29,6 +35,7 @@ from recipes.meal_paln.workers import MealPlanWorker
 from recipes.services import RecipeService
 from shopping_list.workers import ShoppingListWorker
 from stock.forecast.consumption.sarimax import SARIMAXConsumptionForecaster
+from stock.log.store import StockLogStore
 from stores.kaufland.kaufland_api import KauflandApi
 from stores.kaufland.service import KauflandCounter
 from stores.lidl.service import LidlCounter
@@ -37,6 +44,9 @@ from stores.netto.service import NettoCounter
 from stores.rewe.rewe_api import ReweAPI
 from stores.rewe.service import ReweCounter
 from stores.services import StoreService, GrocyStoreService
+from utils import nlp
+from utils.scheduler import RequestScheduler
+from utils.warmup import WarmUp
 
 
 class AIOClientSession(resources.AsyncResource):
@@ -57,6 +67,10 @@ class WorkerResource(resources.AsyncResource):
         await worker.cancel()
 
 
+def get_bulk_backend(backend: str | None):
+    return backend or "rest"
+
+
 def get_base_url(host: str, port: int):
     url = host
     if port not in [80, 443]:
@@ -72,6 +86,12 @@ class Container(containers.DeclarativeContainer):
         level=logging.INFO
     )
 
+    nlp_models = providers.Resource(
+        nlp.configure,
+        models=config.nlp.models,
+        disable=config.nlp.disable
+    )
+
     grocy_client_session = providers.Resource(
         AIOClientSession,
         base_url=providers.Singleton(
@@ -86,19 +106,65 @@ class Container(containers.DeclarativeContainer):
         })
     )
 
+    warm_up = providers.ThreadSafeSingleton(
+        WarmUp
+    )
+
     templates = providers.ThreadSafeSingleton(
         Jinja2Templates,
         directory="templates"
     )
 
+    grocy_request_scheduler = providers.ThreadSafeSingleton(
+        RequestScheduler,
+        name="GrocyRequestScheduler",
+        max_reads=config.grocy.max_reads,
+        max_writes=config.grocy.max_writes,
+        retries=config.grocy.retries
+    )
+
     grocy_api = providers.ThreadSafeSingleton(
         GrocyAPI,
-        session=grocy_client_session
+        session=grocy_client_session,
+        scheduler=grocy_request_scheduler,
+        json_backend=config.grocy.json_backend
+    )
+
+    grocy_bulk_reader = providers.Selector(
+        providers.Callable(
+            get_bulk_backend,
+            backend=config.grocy.bulk_backend
+        ),
+        rest=grocy_api,
+        sqlite=providers.ThreadSafeSingleton(
+            GrocySQLiteReader,
+            path=config.grocy.db_path
+        )
+    )
+
+    qu_conversion_resolver = providers.ThreadSafeSingleton(
+        QuConversionResolver
+    )
+
+    grocy_mirror = providers.ThreadSafeSingleton(
+        GrocyMirror,
+        grocy_api=grocy_bulk_reader,
+        conversion_resolver=qu_conversion_resolver
+    )
+
+    grocy_write_queue = providers.ThreadSafeSingleton(
+        GrocyWriteQueue,
+        grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror
     )
 
     grocy_index = providers.ThreadSafeSingleton(
         GrocyIndex,
-        grocy_api=grocy_api
+        grocy_mirror=grocy_mirror,
+        lemmatize_processes=config.index.lemmatize_processes,
+        fuzzy_threshold=config.index.fuzzy_threshold,
+        semantic_threshold=config.index.semantic_threshold,
+        search_backend=config.index.backend
     )
 
     quantity_provider = providers.Factory(
@@ -115,23 +181,59 @@ class Container(containers.DeclarativeContainer):
         quantity_provider=quantity_provider
     )
 
+    markt_guru_client_session = providers.Resource(
+        AIOClientSession,
+        base_url=providers.Singleton(
+            get_base_url,
+            host=config.markt_guru.host,
+            port=config.markt_guru.port
+        ),
+        headers=providers.Dict({
+            "x-clientkey": config.markt_guru.client_key,
+            "x-apikey": config.markt_guru.api_key
+        })
+    )
+
+    markt_guru_request_scheduler = providers.ThreadSafeSingleton(
+        RequestScheduler,
+        name="MarktGuruRequestScheduler",
+        max_reads=config.markt_guru.max_requests,
+        retries=config.markt_guru.retries
+    )
+
     markt_guru_api = providers.ThreadSafeSingleton(
         MarktGuruAPI,
-        host=config.markt_guru.host,
-        port=config.markt_guru.port,
-        api_key=config.markt_guru.api_key,
-        client_key=config.markt_guru.client_key,
-        zip_code=config.markt_guru.zip_code
+        session=markt_guru_client_session,
+        zip_code=config.markt_guru.zip_code,
+        scheduler=markt_guru_request_scheduler
     )
 
     offer_index = providers.ThreadSafeSingleton(
-        OfferIndex
+        OfferIndex,
+        lemmatize_processes=config.index.lemmatize_processes,
+        semantic_threshold=config.index.semantic_threshold,
+        search_backend=config.index.backend
+    )
+
+    offer_snapshot_store = providers.ThreadSafeSingleton(
+        OfferSnapshotStore,
+        path=config.markt_guru.snapshot_path,
+        retention_days=config.markt_guru.retention_days
     )
 
     markt_guru_service = providers.ThreadSafeSingleton(
         MarktGuruOffersService,
         api=markt_guru_api,
-        offer_index=offer_index
+        offer_index=offer_index,
+        snapshot_store=offer_snapshot_store,
+        max_age=config.markt_guru.max_age,
+        legacy_offers_path=config.markt_guru.offers_path
+    )
+
+    offer_refresh_worker = providers.Resource(
+        WorkerResource,
+        worker_class=OfferRefreshWorker,
+        offers_service=markt_guru_service
     )
 
     offers_service = providers.ThreadSafeSingleton(
@@ -147,17 +249,26 @@ class Container(containers.DeclarativeContainer):
     product_service: providers.Provider[ProductService] = providers.ThreadSafeSingleton(
         GrocyProductService,
         grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror,
         grocy_index=grocy_index
     )
 
+    stock_log_store = providers.ThreadSafeSingleton(
+        StockLogStore,
+        grocy_api=grocy_bulk_reader
+    )
+
     consumption_forecaster = providers.ThreadSafeSingleton(
         SARIMAXConsumptionForecaster,
-        grocy_api=grocy_api
+        grocy_mirror=grocy_mirror,
+        stock_log=stock_log_store
     )
 
     offer_integration = providers.ThreadSafeSingleton(
         GrocyOfferIntegration,
         grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror,
+        write_queue=grocy_write_queue,
         offers_service=offers_service,
         grocy_qu_offer_filter=grocy_qu_offer_filter.provider,
         product_service=product_service,
@@ -173,6 +284,7 @@ class Container(containers.DeclarativeContainer):
         scrape_recipe=scrape_recipe.provider,
         grocy_index=grocy_index,
         grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror,
         product_service=product_service
     )
 
@@ -292,6 +404,7 @@ class Container(containers.DeclarativeContainer):
     product_and_barcode_update_handler = providers.ThreadSafeSingleton(
         GrocyDataUpdateProductAndBarcodeHandler,
         grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror,
         grocy_index=grocy_index,
         product_datasource=product_datasource
     )
@@ -312,6 +425,7 @@ class Container(containers.DeclarativeContainer):
     store_service: providers.Provider[StoreService] = providers.ThreadSafeSingleton(
         GrocyStoreService,
         grocy_api=grocy_api,
+        grocy_mirror=grocy_mirror,
         grocy_index=grocy_index,
         lidl_api=lidl,
         product_db=product_datasource,
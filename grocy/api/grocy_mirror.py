@@ -0,0 +1,164 @@
+import asyncio
+import copy
+import logging
+import time
+from typing import AsyncIterator
+
+from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_sqlite import GrocySQLiteReader
+from grocy.conversion_resolver import QuConversionResolver
+from products.quantity.conversion_index import ConversionIndex
+
+
+class GrocySnapshot:
+    def __init__(self, changed_time: str, products, qus, qu_conversions, barcodes, stores, userfields,
+                 shopping_list):
+        self.changed_time = changed_time
+        self.products = products
+        self.qus = qus
+        self.qu_conversions = qu_conversions
+        self.barcodes = barcodes
+        self.stores = stores
+        self.userfields = userfields
+        self.shopping_list = shopping_list
+        self.shopping_list_by_id = {item['id']: item for item in shopping_list}
+        self.products_by_id = {product['id']: product for product in products}
+        self.qus_by_id = {qu['id']: qu for qu in qus}
+        self.barcodes_by_product = {}
+        for barcode in barcodes:
+            self.barcodes_by_product.setdefault(barcode['product_id'], []).append(barcode)
+        self.__conversion_index = None
+        self.__to_stock_conversions = None
+        self.__to_price_conversions = None
+
+    def get_conversion_index(self) -> ConversionIndex:
+        if self.__conversion_index is None:
+            self.__conversion_index = ConversionIndex(self.qu_conversions)
+        return self.__conversion_index
+
+    def get_to_stock_conversions(self):
+        if self.__to_stock_conversions is None:
+            index = self.get_conversion_index()
+            self.__to_stock_conversions = {product_id: index.conversions_to(product_id, product['qu_id_stock']) for
+                                           product_id, product in self.products_by_id.items()}
+        return self.__to_stock_conversions
+
+    def get_to_price_conversions(self):
+        if self.__to_price_conversions is None:
+            index = self.get_conversion_index()
+            self.__to_price_conversions = {product_id: index.conversions_to(product_id, product['qu_id_price']) for
+                                           product_id, product in self.products_by_id.items()}
+        return self.__to_price_conversions
+
+
+class GrocyMirror:
+    """
+    In-process snapshot of the Grocy master data (products, quantity units, conversions, barcodes, stores and
+    userfields) and the shopping list. The snapshot is refetched only when /api/system/db-changed-time moves. The
+    database change time is checked at most every check_interval seconds, pipelines that depend on their own earlier
+    writes call invalidate() when they start.
+
+    With a QuConversionResolver only the raw quantity_unit_conversions table is downloaded and resolved locally,
+    otherwise Grocy's quantity_unit_conversions_resolved view is downloaded.
+
+    The snapshot is read through grocy_api, which can also be a GrocySQLiteReader when Grocy runs on the same host.
+
+    Objects returned from the get_* methods are copies and can be modified freely. The conversion maps are shared
+    between callers and must be treated as read only.
+    """
+
+    def __init__(self, grocy_api: GrocyAPI | GrocySQLiteReader, conversion_resolver: QuConversionResolver | None = None,
+                 check_interval: float = 10):
+        self.logger = logging.getLogger("GrocyMirror")
+        self.grocy_api = grocy_api
+        self.conversion_resolver = conversion_resolver
+        self.check_interval = check_interval
+        self.snapshot: GrocySnapshot | None = None
+        self.last_check = 0.0
+        self.lock = asyncio.Lock()
+
+    def invalidate(self):
+        """
+        Force a database change time check on the next access.
+        """
+        self.last_check = 0.0
+
+    def __is_checked(self) -> bool:
+        return self.snapshot is not None and time.monotonic() - self.last_check < self.check_interval
+
+    async def get_snapshot(self) -> GrocySnapshot:
+        if self.__is_checked():
+            return self.snapshot
+        async with self.lock:
+            if self.__is_checked():
+                return self.snapshot
+            changed_time = await self.grocy_api.get_db_changed_time()
+            if self.snapshot is None or self.snapshot.changed_time != changed_time:
+                self.snapshot = await self.__fetch(changed_time)
+            self.last_check = time.monotonic()
+            return self.snapshot
+
+    @staticmethod
+    async def __collect(rows: AsyncIterator[dict]) -> list[dict]:
+        return [row async for row in rows]
+
+    async def __fetch(self, changed_time: str) -> GrocySnapshot:
+        self.logger.info(f"Grocy database changed at {changed_time}, refreshing snapshot.")
+        start = time.time()
+        if self.conversion_resolver is not None:
+            get_qu_conversions = self.grocy_api.get_qu_conversions()
+        else:
+            get_qu_conversions = self.__collect(self.grocy_api.stream_qu_conversions_resolved())
+        # The largest tables are decoded row by row, their raw response is never held in memory as a whole
+        products, qus, qu_conversions, barcodes, stores, userfields, shopping_list = await asyncio.gather(
+            self.grocy_api.get_products(), self.grocy_api.get_qus(), get_qu_conversions,
+            self.__collect(self.grocy_api.stream_barcodes()), self.grocy_api.get_stores(),
+            self.grocy_api.get_userfields(), self.grocy_api.get_shopping_list())
+        if self.conversion_resolver is not None:
+            qu_conversions = self.conversion_resolver.resolve(products, qus, qu_conversions)
+        snapshot = GrocySnapshot(changed_time, products=products, qus=qus, qu_conversions=qu_conversions,
+                                 barcodes=barcodes, stores=stores, userfields=userfields, shopping_list=shopping_list)
+        self.logger.info(f"Snapshot with {len(products)} products refreshed in {time.time() - start}")
+        return snapshot
+
+    async def get_products(self):
+        return copy.deepcopy((await self.get_snapshot()).products)
+
+    async def get_product(self, product_id: int):
+        return copy.deepcopy((await self.get_snapshot()).products_by_id.get(product_id))
+
+    async def get_qus(self):
+        return copy.deepcopy((await self.get_snapshot()).qus)
+
+    async def get_qu_conversions_resolved(self):
+        return copy.deepcopy((await self.get_snapshot()).qu_conversions)
+
+    async def get_barcodes(self, product_id: int | None = None):
+        snapshot = await self.get_snapshot()
+        if product_id is None:
+            return copy.deepcopy(snapshot.barcodes)
+        return copy.deepcopy(snapshot.barcodes_by_product.get(product_id, []))
+
+    async def get_stores(self):
+        return copy.deepcopy((await self.get_snapshot()).stores)
+
+    async def get_store(self, store_id: int):
+        for store in (await self.get_snapshot()).stores:
+            if store['id'] == store_id:
+                return copy.deepcopy(store)
+        raise Exception(f"Store with {store_id} not found.")
+
+    async def get_shopping_list(self):
+        return copy.deepcopy((await self.get_snapshot()).shopping_list)
+
+    async def get_userfields(self):
+        return copy.deepcopy((await self.get_snapshot()).userfields)
+
+    async def get_conversion_index(self) -> ConversionIndex:
+        return (await self.get_snapshot()).get_conversion_index()
+
+    async def get_to_stock_conversions(self):
+        return (await self.get_snapshot()).get_to_stock_conversions()
+
+    async def get_to_price_conversions(self):
+        return (await self.get_snapshot()).get_to_price_conversions()
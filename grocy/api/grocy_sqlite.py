@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+
+class GrocySQLiteReader:
+    """
+    Read-only access to the SQLite database of a Grocy instance running on the same host. Implements the bulk read
+    methods of GrocyAPI and returns rows in the same format as the REST API, objects include their userfields. Writes
+    must still go through GrocyAPI, the database is opened in read-only mode.
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        self.logger = logging.getLogger("GrocySQLiteReader")
+        if not os.path.exists(path):
+            raise Exception(f"Grocy database {path} not found.")
+        self.path = path
+        self.batch_size = batch_size
+        self.logger.info(f"Grocy SQLite reader initialized for {path}.")
+
+    def __connect(self, check_same_thread: bool = True):
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=check_same_thread)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def __get_userfields(self, connection, entity: str):
+        fields = connection.execute("SELECT id, name FROM userfields WHERE entity = ?", (entity,)).fetchall()
+        if len(fields) == 0:
+            return None
+        names = {field['id']: field['name'] for field in fields}
+        values = {}
+        for row in connection.execute("SELECT v.field_id, v.object_id, v.value FROM userfield_values v "
+                                      "JOIN userfields f ON f.id = v.field_id WHERE f.entity = ?", (entity,)):
+            values.setdefault(row['object_id'], {})[names[row['field_id']]] = row['value']
+        return names, values
+
+    @staticmethod
+    def __add_userfields(row: dict, userfields):
+        if userfields is None:
+            row['userfields'] = None
+        else:
+            names, values = userfields
+            object_values = values.get(row['id'], {})
+            row['userfields'] = {name: object_values.get(name) for name in names.values()}
+        return row
+
+    def __query(self, sql: str, params=(), entity: str | None = None):
+        with closing(self.__connect()) as connection:
+            rows = [dict(row) for row in connection.execute(sql, params)]
+            if entity is not None:
+                userfields = self.__get_userfields(connection, entity)
+                for row in rows:
+                    self.__add_userfields(row, userfields)
+        return rows
+
+    async def _read(self, sql: str, params=(), entity: str | None = None):
+        return await asyncio.to_thread(self.__query, sql, params, entity)
+
+    async def _stream(self, sql: str, params=(), entity: str | None = None):
+        """
+        Yield the rows of the query in batches of batch_size, so the whole result is never in memory.
+        """
+        connection = await asyncio.to_thread(self.__connect, False)
+        try:
+            userfields = None
+            if entity is not None:
+                userfields = await asyncio.to_thread(self.__get_userfields, connection, entity)
+            cursor = await asyncio.to_thread(connection.execute, sql, params)
+            while True:
+                rows = await asyncio.to_thread(cursor.fetchmany, self.batch_size)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    if entity is not None:
+                        yield self.__add_userfields(dict(row), userfields)
+                    else:
+                        yield dict(row)
+        finally:
+            connection.close()
+
+    def __get_changed_time(self):
+        # Committed transactions stay in the write-ahead log until the next checkpoint
+        mtime = max(os.path.getmtime(path) for path in [self.path, self.path + "-wal"] if os.path.exists(path))
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime))
+
+    async def get_db_changed_time(self):
+        return self.__get_changed_time()
+
+    async def get_userfields(self):
+        return await self._read("SELECT * FROM userfields", entity="userfields")
+
+    async def get_stores(self):
+        return await self._read("SELECT * FROM shopping_locations", entity="shopping_locations")
+
+    async def get_locations(self):
+        return await self._read("SELECT * FROM locations", entity="locations")
+
+    async def get_shopping_lists(self):
+        return await self._read("SELECT * FROM shopping_lists", entity="shopping_lists")
+
+    async def get_shopping_list(self):
+        return await self._read("SELECT * FROM shopping_list", entity="shopping_list")
+
+    async def get_products(self):
+        return await self._read("SELECT * FROM products", entity="products")
+
+    async def get_barcodes(self, product_id: int | None = None):
+        if product_id is not None:
+            return await self._read("SELECT * FROM product_barcodes WHERE product_id = ?", (product_id,),
+                                    entity="product_barcodes")
+        return await self._read("SELECT * FROM product_barcodes", entity="product_barcodes")
+
+    async def get_qus(self):
+        return await self._read("SELECT * FROM quantity_units", entity="quantity_units")
+
+    async def get_qu_conversions(self):
+        return await self._read("SELECT * FROM quantity_unit_conversions", entity="quantity_unit_conversions")
+
+    async def get_qu_conversions_resolved(self):
+        return await self._read("SELECT * FROM quantity_unit_conversions_resolved")
+
+    async def get_consumption_log(self, product_id: int | None = None):
+        sql = "SELECT * FROM stock_log WHERE transaction_type = 'consume' AND undone = 0 AND spoiled = 0"
+        if product_id is not None:
+            return await self._read(sql + " AND product_id = ?", (product_id,))
+        return await self._read(sql)
+
+    @staticmethod
+    def __get_stock_log_query(min_id: int | None = None):
+        if min_id is not None:
+            return "SELECT * FROM stock_log WHERE id > ? ORDER BY id", (min_id,)
+        return "SELECT * FROM stock_log ORDER BY id", ()
+
+    async def get_stock_log(self, min_id: int | None = None):
+        return await self._read(*GrocySQLiteReader.__get_stock_log_query(min_id))
+
+    def stream_stock_log(self, min_id: int | None = None):
+        return self._stream(*GrocySQLiteReader.__get_stock_log_query(min_id))
+
+    def stream_barcodes(self):
+        return self._stream("SELECT * FROM product_barcodes", entity="product_barcodes")
+
+    def stream_qu_conversions_resolved(self):
+        return self._stream("SELECT * FROM quantity_unit_conversions_resolved")
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+
+from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror, GrocySnapshot
+
+USER_FIELDS = "userfields"
+OBJECTS = "objects"
+
+
+def normalize_value(value):
+    """
+    Grocy returns userfield and most object values as strings, normalize the written values so they can be compared.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class GrocyWriteQueue:
+    """
+    Write-behind queue for userfield and object updates. Repeated writes to the same (entity, object id) are merged
+    until the queue is flushed, either explicitly or flush_window seconds after the first queued write. Fields which
+    equal the value in the GrocyMirror snapshot are not written at all.
+    """
+
+    def __init__(self, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror, flush_window: float = 5,
+                 max_parallel: int = 4):
+        self.logger = logging.getLogger("GrocyWriteQueue")
+        self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
+        self.flush_window = flush_window
+        self.max_parallel = max_parallel
+        self.pending = {}
+        self.queued = 0
+        self.merged = 0
+        self.flush_task = None
+        self.flush_lock = asyncio.Lock()
+
+    async def update_user_fields(self, entity_type: str, object_id: int, fields):
+        self.__enqueue((USER_FIELDS, entity_type, object_id), fields)
+
+    async def update_object(self, entity: str, object_id: int, data):
+        data = {key: value for key, value in data.items() if key not in ["id", USER_FIELDS]}
+        self.__enqueue((OBJECTS, entity, object_id), data)
+
+    async def update_shopping_list(self, item):
+        await self.update_object("shopping_list", item['id'], item)
+
+    def __enqueue(self, key, data):
+        self.queued += 1
+        if key in self.pending:
+            self.merged += 1
+            self.pending[key].update(data)
+        else:
+            self.pending[key] = dict(data)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.__delayed_flush())
+            self.flush_task.add_done_callback(self.__log_failure)
+
+    async def __delayed_flush(self):
+        await asyncio.sleep(self.flush_window)
+        # Once the window passed the task is not cancelled by flush() anymore, flush() waits for it on the lock
+        self.flush_task = None
+        return await self.__flush()
+
+    def __log_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Delayed flush failed.", exc_info=task.exception())
+
+    @staticmethod
+    def __get_current(snapshot: GrocySnapshot, key):
+        kind, entity, object_id = key
+        if entity == "products":
+            current = snapshot.products_by_id.get(object_id)
+        elif entity == "shopping_list":
+            current = snapshot.shopping_list_by_id.get(object_id)
+        else:
+            return None
+        if current is not None and kind == USER_FIELDS:
+            return current.get(USER_FIELDS)
+        return current
+
+    @staticmethod
+    def __get_changes(data, current):
+        if current is None:
+            return data
+        return {field: value for field, value in data.items() if
+                field not in current or normalize_value(value) != normalize_value(current[field])}
+
+    async def __write(self, key, data):
+        kind, entity, object_id = key
+        if kind == USER_FIELDS:
+            await self.grocy_api.update_user_fields(entity, object_id, data)
+        else:
+            await self.grocy_api.update_object(entity, object_id, data)
+
+    async def flush(self):
+        """
+        Write all pending changes, a scheduled delayed flush is cancelled and one that is already writing is waited for.
+        :return: counts of queued, merged, skipped, written and failed writes since the last flush
+        """
+        flush_task, self.flush_task = self.flush_task, None
+        if flush_task is not None:
+            flush_task.cancel()
+        return await self.__flush()
+
+    async def __flush(self):
+        async with self.flush_lock:
+            return await self.__write_pending()
+
+    async def __write_pending(self):
+        pending, self.pending = self.pending, {}
+        stats = {"queued": self.queued, "merged": self.merged, "skipped": 0, "written": 0, "failed": 0}
+        self.queued = 0
+        self.merged = 0
+        if len(pending) == 0:
+            return stats
+        start = time.time()
+        snapshot = await self.grocy_mirror.get_snapshot()
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def write(key, data):
+            changes = self.__get_changes(data, self.__get_current(snapshot, key))
+            if len(changes) == 0:
+                stats["skipped"] += 1
+                return
+            async with semaphore:
+                try:
+                    await self.__write(key, changes)
+                    stats["written"] += 1
+                except Exception:
+                    stats["failed"] += 1
+                    self.logger.exception(f"Writing {key} failed.")
+
+        await asyncio.gather(*[write(key, data) for key, data in pending.items()])
+        if stats["written"] > 0:
+            self.grocy_mirror.invalidate()
+        self.logger.info(f"Flushed {stats} in {time.time() - start}")
+        return stats
@@ -0,0 +1,91 @@
+import logging
+import time
+from collections import deque
+
+
+class QuConversionResolver:
+    """
+    Resolves the raw quantity_unit_conversions table the same way Grocy's quantity_unit_conversions_resolved view
+    does, without downloading the view.
+
+    For every product the conversion graph consists of its product specific conversions and the default conversions
+    (without product) that are not overridden by a product specific conversion of the same units. A pair of units is
+    convertible when there is a path between them that passes through the stock unit of the product or uses at
+    least one product specific conversion. The factor is the product of the factors along the shortest such path. The
+    stock unit converts to itself with factor 1.
+
+    Products with the same stock unit and the same product specific conversions resolve to the same pairs, their
+    results are computed once.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("QuConversionResolver")
+
+    @staticmethod
+    def __resolve_graph(stock_qu_id: int, product_conversions, default_conversions):
+        edges = {}
+        for c in default_conversions:
+            edges[(c['from_qu_id'], c['to_qu_id'])] = (c['factor'], False)
+        for from_qu_id, to_qu_id, factor in product_conversions:
+            edges[(from_qu_id, to_qu_id)] = (factor, True)
+        adjacency = {}
+        # Product specific conversions first, so they win between paths of the same length
+        for (from_qu_id, to_qu_id), (factor, product_specific) in sorted(edges.items(), key=lambda e: not e[1][1]):
+            adjacency.setdefault(from_qu_id, []).append((to_qu_id, factor, product_specific))
+
+        pairs = {(stock_qu_id, stock_qu_id): 1.0}
+        for start in adjacency:
+            start_touched = start == stock_qu_id
+            visited = {(start, start_touched)}
+            queue = deque([(start, start_touched, 1.0, {start})])
+            while len(queue) > 0:
+                qu_id, touched, factor, path = queue.popleft()
+                for to_qu_id, edge_factor, product_specific in adjacency.get(qu_id, []):
+                    if to_qu_id in path:
+                        continue
+                    to_touched = touched or product_specific or to_qu_id == stock_qu_id
+                    if (to_qu_id, to_touched) in visited:
+                        continue
+                    visited.add((to_qu_id, to_touched))
+                    to_factor = factor * edge_factor
+                    if to_touched and (start, to_qu_id) not in pairs:
+                        pairs[(start, to_qu_id)] = to_factor
+                    queue.append((to_qu_id, to_touched, to_factor, path | {to_qu_id}))
+        return pairs
+
+    def resolve(self, products, qus, conversions):
+        """
+        :param products: rows of the products table
+        :param qus: rows of the quantity_units table
+        :param conversions: rows of the quantity_unit_conversions table
+        :return: rows in the format of the quantity_unit_conversions_resolved view
+        """
+        start = time.time()
+        qus_by_id = {qu['id']: qu for qu in qus}
+        default_conversions = [c for c in conversions if c['product_id'] is None]
+        product_conversions = {}
+        for c in conversions:
+            if c['product_id'] is not None:
+                product_conversions.setdefault(c['product_id'], []).append(
+                    (c['from_qu_id'], c['to_qu_id'], c['factor']))
+
+        cache = {}
+        resolved = []
+        for product in products:
+            signature = (product['qu_id_stock'], tuple(sorted(product_conversions.get(product['id'], []))))
+            pairs = cache.get(signature)
+            if pairs is None:
+                pairs = self.__resolve_graph(signature[0], signature[1], default_conversions)
+                cache[signature] = pairs
+            for (from_qu_id, to_qu_id), factor in pairs.items():
+                from_qu = qus_by_id.get(from_qu_id)
+                to_qu = qus_by_id.get(to_qu_id)
+                if from_qu is None or to_qu is None:
+                    continue
+                resolved.append({"id": len(resolved) + 1, "product_id": product['id'], "from_qu_id": from_qu_id,
+                                 "from_qu_name": from_qu['name'], "from_qu_name_plural": from_qu['name_plural'],
+                                 "to_qu_id": to_qu_id, "to_qu_name": to_qu['name'],
+                                 "to_qu_name_plural": to_qu['name_plural'], "factor": factor})
+        self.logger.info(f"Resolved {len(resolved)} conversions of {len(products)} products from {len(cache)} "
+                         f"distinct conversion graphs in {time.time() - start}")
+        return resolved
@@ -1,17 +1,20 @@
+import asyncio
 import logging
 import time
+from contextlib import contextmanager
 from html.parser import HTMLParser
 from io import StringIO
 
 from pint import UnitRegistry
-from tqdm import tqdm
-from whoosh import writing
 from whoosh.analysis import KeywordAnalyzer, SimpleAnalyzer, LanguageAnalyzer
 from whoosh.fields import Schema, TEXT, ID
-from whoosh.index import create_in, open_dir, exists_in
-from whoosh.qparser import MultifieldParser, OrGroup
+from whoosh.qparser import OrGroup
 
-from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
+from utils.search.backends import create_search_index
+from utils.search.embedding import EmbeddingIndex, embed
+from utils.search.trigram import TrigramIndex
+from utils.whoosh.lemmatizer import BulkLemmatizer, lemmatize_documents
 from utils.whoosh.tokenizers import LemmaTokenizer
 
 
@@ -37,72 +40,162 @@ def strip_tags(html):
 
 
 class GrocyIndex:
-    def __init__(self, grocy_api: GrocyAPI):
+    def __init__(self, grocy_mirror: GrocyMirror, lemmatize_processes: int | None = None,
+                 fuzzy_threshold: float | None = None, semantic_threshold: float | None = None,
+                 search_backend: str | None = None):
         self.logger = logging.getLogger("GrocyIndex")
-        self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
         self.en_analyser = LemmaTokenizer(lang="en")
         self.de_analyser = LemmaTokenizer(lang="de")
         self.mk_analyser = LanguageAnalyzer(lang="mk")
+        en_lemmatizer = BulkLemmatizer(self.en_analyser, n_process=lemmatize_processes)
+        self.product_lemmatizers = {"name_en": en_lemmatizer, "description": en_lemmatizer,
+                                    "name_de": BulkLemmatizer(self.de_analyser, n_process=lemmatize_processes)}
         self.qu_analyser = KeywordAnalyzer(lowercase=True)
         self.product_schema = Schema(name_en=TEXT(stored=True, analyzer=self.en_analyser),
                                      name_de=TEXT(stored=True, analyzer=self.de_analyser),
                                      name_mk=TEXT(stored=True, analyzer=self.mk_analyser),
-                                     description=TEXT(stored=True, analyzer=self.en_analyser), id=ID(stored=True))
-        if exists_in("index/products"):
-            self.product_ix = open_dir("index/products", schema=self.product_schema)
-        else:
-            self.product_ix = create_in("index/products", schema=self.product_schema)
+                                     description=TEXT(stored=True, analyzer=self.en_analyser),
+                                     id=ID(stored=True, unique=True), hash=ID(stored=True))
+        self.product_index = create_search_index(search_backend, "products", self.product_schema,
+                                                 ["name_en", "name_de", "name_mk", "description"], group=OrGroup)
         self.qu_schema = Schema(name=TEXT(stored=True, analyzer=self.qu_analyser),
                                 name_pl=TEXT(stored=True, analyzer=SimpleAnalyzer()), description=TEXT(stored=True),
-                                id=ID(stored=True))
-        if exists_in("index/qus"):
-            self.qu_ix = open_dir("index/qus", schema=self.qu_schema)
-        else:
-            self.qu_ix = create_in("index/qus", schema=self.qu_schema)
+                                id=ID(stored=True, unique=True), hash=ID(stored=True))
+        self.qu_index = create_search_index(search_backend, "qus", self.qu_schema, ["name", "name_pl", "description"],
+                                            group=OrGroup)
         self.unit_parser = UnitRegistry().Unit
+        self.fuzzy_threshold = fuzzy_threshold if fuzzy_threshold is not None else 0.6
+        self.semantic_threshold = semantic_threshold if semantic_threshold is not None else 0.7
+
+    @staticmethod
+    def __build_fuzzy_index(documents) -> TrigramIndex:
+        return TrigramIndex([(document['id'], document[field]) for document in documents
+                             for field in ["name_en", "name_de", "name_mk"] if document.get(field)])
+
+    def __get_fuzzy_index(self) -> TrigramIndex:
+        return self.product_index.get_derived("fuzzy index", GrocyIndex.__build_fuzzy_index)
+
+    def __build_embedding_index(self, documents) -> EmbeddingIndex:
+        documents = [document for document in documents if document.get('name_de')]
+        return EmbeddingIndex([document['id'] for document in documents],
+                              embed(self.de_analyser.nlp, [document['name_de'] for document in documents]))
+
+    def query_product_semantic_many(self, product_texts: list[str], limit: int = 1) -> list[list[dict]]:
+        """
+        Match the texts against the word vector embeddings of the German product names with one matrix product, for
+        names that share no words with the product, e.g. synonyms.
+        :return: best matching products with at least semantic_threshold cosine similarity, with their id and score
+        """
+        if len(product_texts) == 0:
+            return []
+        embedding_index = self.product_index.get_derived("embedding index", self.__build_embedding_index)
+        results = embedding_index.search_many(embed(self.de_analyser.nlp, product_texts), limit=limit,
+                                              threshold=self.semantic_threshold)
+        return [[{"id": product_id, "score": score} for product_id, score in result] for result in results]
+
+    def query_product_fuzzy(self, product_text: str, limit: int = 1) -> list[dict]:
+        """
+        Match the text against the trigrams of all product name variants, for abbreviated or truncated names like
+        the ones on receipts.
+        :return: best matching products with at least fuzzy_threshold similarity, with their id, name and score
+        """
+        return self.__get_fuzzy_index().search(product_text, limit=limit, threshold=self.fuzzy_threshold)
+
+    def get_stats(self):
+        return {"products": self.product_index.get_stats(), "qus": self.qu_index.get_stats(),
+                "lemmas": {"en": {"hits": self.en_analyser.lemma_table.hits,
+                                  "misses": self.en_analyser.lemma_table.misses},
+                           "de": {"hits": self.de_analyser.lemma_table.hits,
+                                  "misses": self.de_analyser.lemma_table.misses}}}
 
     def query_product_index(self, product_text: str):
         self.logger.debug(f"Querying product index with text: {product_text}")
-        with self.product_ix.searcher() as searcher:
-            query_parser = MultifieldParser(["name_en", "name_de", "name_mk", "description"], self.product_ix.schema,
-                                            group=OrGroup)
-            query = query_parser.parse(product_text)
-            results = searcher.search(query, limit=1)
-            return [dict(result) for result in results]
+        results = self.product_index.search(product_text, limit=1)
+        if len(results) == 0:
+            results = self.query_product_fuzzy(product_text)
+        if len(results) == 0:
+            results = self.query_product_semantic_many([product_text])[0]
+        return results
 
     def query_qu_index(self, qu_text: str):
         self.logger.debug(f"Querying qu index with text: {qu_text}")
-        with self.qu_ix.searcher() as searcher:
-            query_parser = MultifieldParser(["name", "name_pl", "description"], self.qu_ix.schema, group=OrGroup)
-            query = query_parser.parse(qu_text)
-            results = searcher.search(query, limit=1)
-            if len(results) == 0:
+        results = self.qu_index.search(qu_text, limit=1)
+        if len(results) == 0:
+            try:
+                results = self.qu_index.search(str(self.unit_parser(qu_text)), limit=1)
+            except:
+                pass
+        return results
+
+    def query_product_index_many(self, product_texts: list[str]) -> list[list[dict]]:
+        """
+        Batch version of query_product_index. The words of texts without cached results that are not in the lemma
+        tables are lemmatized in one pass and all texts are searched with the same searcher.
+        :return: results for every text in the order of product_texts
+        """
+        self.logger.debug(f"Querying product index with {len(product_texts)} texts")
+        results = self.product_index.search_many(product_texts, limit=1, prime=self.__primed)
+        results = [result if len(result) > 0 else self.query_product_fuzzy(product_text)
+                   for product_text, result in zip(product_texts, results)]
+        unmatched = [i for i, result in enumerate(results) if len(result) == 0]
+        semantic_results = self.query_product_semantic_many([product_texts[i] for i in unmatched])
+        for i, result in zip(unmatched, semantic_results):
+            results[i] = result
+        return results
+
+    @contextmanager
+    def __primed(self, texts: list[str]):
+        words = [word for text in texts for word in text.split()]
+        with self.en_analyser.primed(words), self.de_analyser.primed(words):
+            yield
+
+    def query_qu_index_many(self, qu_texts: list[str]) -> list[list[dict]]:
+        """
+        Batch version of query_qu_index.
+        :return: results for every text in the order of qu_texts
+        """
+        self.logger.debug(f"Querying qu index with {len(qu_texts)} texts")
+        results = dict(zip(qu_texts, self.qu_index.search_many(qu_texts, limit=1)))
+        unit_texts = {}
+        for qu_text, result in results.items():
+            if len(result) == 0:
                 try:
-                    query = query_parser.parse(str(self.unit_parser(qu_text)))
-                    results = searcher.search(query, limit=1)
+                    unit_texts[qu_text] = str(self.unit_parser(qu_text))
                 except:
                     pass
-            return [dict(result) for result in results]
+        unit_results = self.qu_index.search_many(list(unit_texts.values()), limit=1)
+        results.update(zip(unit_texts.keys(), unit_results))
+        return [results[qu_text] for qu_text in qu_texts]
 
     async def update_product_index(self):
         self.logger.info("Updating product index")
-        writer = self.product_ix.writer()
-        products = await self.grocy_api.get_products()
-        for product in tqdm(products):
+        products = await self.grocy_mirror.get_products()
+        documents = {}
+        for product in products:
             name_en, name_de, name_mk = product['name'].split(" / ")
+            document = {"name_en": name_en, "name_de": name_de, "name_mk": name_mk}
             if product['description'] is not None:
-                description = strip_tags(product['description'])
-                writer.add_document(name_en=name_en, name_de=name_de, name_mk=name_mk, description=description,
-                                    id=str(product['id']))
-            else:
-                writer.add_document(name_en=name_en, name_de=name_de, name_mk=name_mk, id=str(product['id']))
-        writer.commit(mergetype=writing.CLEAR)
+                document["description"] = strip_tags(product['description'])
+            documents[str(product['id'])] = document
+        # Lemmatizing and writing the index run in a thread, queries are served from the previous generation
+        await asyncio.to_thread(self.__sync_product_index, documents)
+
+    def __sync_product_index(self, documents: dict[str, dict]):
+        if len(self.en_analyser.lemma_table) > 0 and len(self.de_analyser.lemma_table) > 0:
+            self.product_index.sync(documents,
+                                    prepare=lambda changed: lemmatize_documents(changed, self.product_lemmatizers))
+            return
+        # Indexes built before the lemma tables existed only reindex changed products, all products are lemmatized
+        # once to fill the tables and the changed ones reuse those lemmas
+        lemmatized = dict(zip(documents.keys(), lemmatize_documents([dict(document) for document in documents.values()],
+                                                                    self.product_lemmatizers)))
+        self.product_index.sync(documents, prepare=lambda changed: [{**document, **lemmatized[document['id']]}
+                                                                    for document in changed])
 
     async def update_qu_index(self):
         self.logger.info("Updating qu index")
-        writer = self.qu_ix.writer()
-        qus = await self.grocy_api.get_qus()
-        for qu in tqdm(qus):
-            writer.add_document(name=qu['name'].lower(), id=str(qu['id']), name_pl=qu['name_plural'],
-                                description=qu['description'])
-        writer.commit(mergetype=writing.CLEAR)
+        qus = await self.grocy_mirror.get_qus()
+        documents = {str(qu['id']): {"name": qu['name'].lower(), "name_pl": qu['name_plural'],
+                                     "description": qu['description']} for qu in qus}
+        await asyncio.to_thread(self.qu_index.sync, documents)
@@ -3,31 +3,27 @@ from typing import Dict
 
 from grocy import GrocyProductUpdateHandler
 from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
 from grocy.index import GrocyIndex
 from products.data.model import ProductDataSource, ProductKey, ProductKeyType, ProductData
 
 
 class GrocyDataUpdateProductAndBarcodeHandler(GrocyProductUpdateHandler):
-    def __init__(self, grocy_api: GrocyAPI, grocy_index: GrocyIndex, product_datasource: ProductDataSource):
+    def __init__(self, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror, grocy_index: GrocyIndex,
+                 product_datasource: ProductDataSource):
         self.logger = logging.getLogger("GrocyDataUpdateProductAndBarcodeHandler")
         self.logger.info("Init")
         self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
         self.grocy_index = grocy_index
-        self.conversions = None
-        self.qus = None
         self.product_datasource = product_datasource
-        self.initialized = False
 
-    async def init(self):
-        self.conversions = await self.grocy_api.get_to_stock_conversions()
-        self.qus = {qu['id']: qu for qu in await self.grocy_api.get_qus()}
-
-    def _barcode_quantity(self, barcode, product_conversions: Dict[int, float]) -> float | None:
+    def _barcode_quantity(self, barcode, product_conversions: Dict[int, float], qus) -> float | None:
         if barcode['qu_id'] is None or barcode['amount'] is None:
             return None
         factor = product_conversions.get(barcode['qu_id'], None)
         if factor is None:
-            qu = self.qus[barcode['qu_id']]
+            qu = qus[barcode['qu_id']]
             self.logger.warning(
                 f"The barcode {barcode['barcode']} specifies qu {qu['name']} but has no conversion rule for it.")
             return None
@@ -53,11 +49,9 @@ class GrocyDataUpdateProductAndBarcodeHandler(GrocyProductUpdateHandler):
         return round(product_data.quantity_amount[0].entry_value * factor, 7)
 
     async def update(self, product):
-        if not self.initialized:
-            await self.init()
-            self.initialized = True
-        product_conversions = self.conversions[product['id']]
-        barcodes = await self.grocy_api.get_barcodes(product['id'])
+        snapshot = await self.grocy_mirror.get_snapshot()
+        product_conversions = snapshot.get_to_stock_conversions().get(product['id'], {})
+        barcodes = await self.grocy_mirror.get_barcodes(product['id'])
         product_data = ProductData()
         for barcode in barcodes:
             updated = False
@@ -68,7 +62,7 @@ class GrocyDataUpdateProductAndBarcodeHandler(GrocyProductUpdateHandler):
                 updated = True
                 barcode['note'] = barcode_data.name[0].entry_value
 
-            barcode_quantity = self._barcode_quantity(barcode, product_conversions)
+            barcode_quantity = self._barcode_quantity(barcode, product_conversions, snapshot.qus_by_id)
             pd_quantity = await self._product_database_quantity(barcode_data, product_conversions)
 
             if barcode_quantity is not None and pd_quantity is not None and barcode_quantity != pd_quantity:
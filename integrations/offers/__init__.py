@@ -11,6 +11,9 @@ import time
 from tqdm import tqdm
 
 from grocy.api.grocy_api import USER_FILES, GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror, GrocySnapshot
+from grocy.api.write_queue import GrocyWriteQueue
+from products.quantity.conversion_index import ConversionIndex
 from integrations.offers.filters import GrocyQuOfferFilter
 from offers.filters import BannedBrandsOfferFilter, SelectedStoresOfferFilter, TimeOfferFilter
 from offers.preferences import BrandOfferPreference
@@ -20,18 +23,20 @@ from stock.forecast.consumption.sarimax import SARIMAXConsumptionForecaster
 
 
 class GrocyOfferIntegration:
-    def __init__(self, grocy_api: GrocyAPI, offers_service: OffersService,
-                 consumption_forecaster: SARIMAXConsumptionForecaster, product_service: ProductService,
-                 grocy_qu_offer_filter: Callable[..., GrocyQuOfferFilter]):
+    def __init__(self, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror, write_queue: GrocyWriteQueue,
+                 offers_service: OffersService, consumption_forecaster: SARIMAXConsumptionForecaster,
+                 product_service: ProductService, grocy_qu_offer_filter: Callable[..., GrocyQuOfferFilter]):
         self.note_start = "=== offer start ===\n"
         self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
+        self.write_queue = write_queue
         self.logger = logging.getLogger("GrocyOffers")
         self.grocy_qu_offer_filter = grocy_qu_offer_filter
         self.offers_service = offers_service
         self.consumption_forecaster = consumption_forecaster
         self.product_service = product_service
 
-    async def __get_offer(self, product, conversions, shopping_time: date = datetime.now().date(),
+    async def __get_offer(self, product, conversion_index: ConversionIndex, shopping_time: date = datetime.now().date(),
                           stores_to_visit: List[str] = None):
         product_user_fields = product['userfields']
 
@@ -42,13 +47,15 @@ class GrocyOfferIntegration:
             product_user_fields['bannedbrands'].split(',') if product_user_fields['bannedbrands'] is not None else [])]
 
         name = product['name'].split("/")[1].strip()
-        offers = self.offers_service.search(name)
+        # Searching may build the offer records on first use, which must not block the event loop
+        offers = await asyncio.to_thread(self.offers_service.search, name)
         offers.add_preference(BrandOfferPreference(preferred_brands))
         offers.add_filter(TimeOfferFilter(shopping_time))
         offers.add_filter(BannedBrandsOfferFilter(banned_brands))
-        offers.add_filter(await self.grocy_qu_offer_filter(allowed_qus=conversions))
+        offers.add_filter(await self.grocy_qu_offer_filter(conversion_index=conversion_index, product_id=product['id'],
+                                                           to_qu_id=product['qu_id_price']))
         offers.add_filter(SelectedStoresOfferFilter(accepted_stores=stores_to_visit))
-        offers.set_sort_order(key=lambda x: (x.preferences["brand"], x.reference_price))
+        offers.set_rank_order(["brand", "reference_price"])
         offer = offers.get_top_offer()
 
         if offer is not None:
@@ -95,17 +102,19 @@ class GrocyOfferIntegration:
         else:
             return 0
 
-        await self.grocy_api.update_user_fields("products", product["id"], product_user_fields)
+        await self.write_queue.update_user_fields("products", product["id"], product_user_fields)
         return 1
 
     async def get_offers(self, stores_to_visit: List[str] = None, shopping_time: date = datetime.now().date()):
         self.logger.info("search offers for each grocy product.")
         start = time.time()
-        products, product_conversions = await asyncio.gather(self.grocy_api.get_products(),
-                                                             self.grocy_api.get_to_price_conversions())
+        self.grocy_mirror.invalidate()
+        products, conversion_index = await asyncio.gather(self.grocy_mirror.get_products(),
+                                                          self.grocy_mirror.get_conversion_index())
         result = await asyncio.gather(*[
-            self.__get_offer(product=product, conversions=product_conversions[product['id']],
-                             shopping_time=shopping_time, stores_to_visit=stores_to_visit) for product in products])
+            self.__get_offer(product=product, conversion_index=conversion_index, shopping_time=shopping_time,
+                             stores_to_visit=stores_to_visit) for product in products])
+        await self.write_queue.flush()
         num_offers = sum(result)
         self.logger.info(
             f"Processed {num_offers} out of {len(products)} in {time.time() - start} or {(num_offers / len(products)) * 100} have offers.")
@@ -119,7 +128,8 @@ class GrocyOfferIntegration:
             b = max(b, 1.1)
         return a * math.tanh((1 / a) * x ** (1 / b))
 
-    async def __collect_offer(self, product, already_in_shopping_list: set[int], max_stock_days: int = 180):
+    async def __collect_offer(self, product, conversion_index: ConversionIndex, already_in_shopping_list: set[int],
+                              max_stock_days: int = 180):
         target_list_id = 1
         if product['id'] in already_in_shopping_list:
             return 1
@@ -130,7 +140,7 @@ class GrocyOfferIntegration:
 
         offer_price = product_user_fields['offerprice']
 
-        factor = product_details.get_conversion(product_details.price_unit.id).factor
+        factor = conversion_index.factor(product['id'], product['qu_id_price'], product['qu_id_stock'])
 
         if product_details.average_shelf_life_days == 0:
             self.logger.warning(f"{product_details.name}({product_details.id}) has average shelf life of 0.")
@@ -140,7 +150,7 @@ class GrocyOfferIntegration:
             product_details.average_shelf_life_days)) if product_details.average_shelf_life_days >= 0 else max_stock_days * 2,
                          max_stock_days * 2)
 
-        if product_details.average_price is not None and offer_price is not None:
+        if product_details.average_price is not None and offer_price is not None and factor is not None:
             average_price = product_details.average_price * factor
             save_percent = 1 - float(offer_price) / average_price
             stock_days = self.__get_stock_days(stock_days, max_stock_days=max_stock_days, save_percent=save_percent)
@@ -163,18 +173,22 @@ class GrocyOfferIntegration:
             {"product_id": product['id'], "shopping_list_id": target_list_id, "amount": amount_to_buy,
              "qu_id": product["qu_id_purchase"], "note": ""})
 
-        res = await self.grocy_api.update_user_fields("shopping_list", int(new_sl_item['created_object_id']), {"generated": True})
-
-        print(res)
+        await self.write_queue.update_user_fields("shopping_list", int(new_sl_item['created_object_id']),
+                                                  {"generated": True})
         return 1
 
     async def collect_interesting_offers(self, max_stock_days: int = 180):
         self.logger.info("Create offer shopping list")
         start = time.time()
-        products, _ = await asyncio.gather(self.grocy_api.get_products(), self.grocy_api.clear_shopping_list(1))
+        self.grocy_mirror.invalidate()
+        products, conversion_index, _ = await asyncio.gather(self.grocy_mirror.get_products(),
+                                                             self.grocy_mirror.get_conversion_index(),
+                                                             self.grocy_api.clear_shopping_list(1))
         already_in_shopping_list = set([item['product_id'] for item in await self.grocy_api.get_shopping_list()])
         result = await asyncio.gather(
-            *[self.__collect_offer(product, already_in_shopping_list, max_stock_days) for product in products])
+            *[self.__collect_offer(product, conversion_index, already_in_shopping_list, max_stock_days) for product in
+              products])
+        await self.write_queue.flush()
 
         self.logger.info(f"Created shopping list with {sum(result)} items in {time.time() - start}")
 
@@ -188,9 +202,12 @@ class GrocyOfferIntegration:
             start -= 1
         return note[:start]
 
-    async def __update_sl_item_notes(self, sl_item):
-        product, fields = await asyncio.gather(self.grocy_api.get_product_details(sl_item['product_id']),
-                                               self.grocy_api.get_user_fields('products', sl_item['product_id']))
+    async def __update_sl_item_notes(self, sl_item, snapshot: GrocySnapshot):
+        product = snapshot.products_by_id.get(sl_item['product_id'])
+        if product is None:
+            return
+        fields = product['userfields']
+        price_qu = snapshot.qus_by_id[product['qu_id_price']]
 
         old_note = sl_item["note"]
         # Remove old offer residuals
@@ -203,18 +220,21 @@ class GrocyOfferIntegration:
             note += self.note_start
 
             name = json.loads(fields['offername'])['title']
-            note += f"{name}: €{fields['offerprice']} per {product['quantity_unit_price']['name']} / {round(float(fields['offeramount']), 2)} {product['quantity_unit_price']['name'] if float(fields['offeramount']) == 1 else product['quantity_unit_price']['name_plural']} \n"
+            note += f"{name}: €{fields['offerprice']} per {price_qu['name']} / {round(float(fields['offeramount']), 2)} {price_qu['name'] if float(fields['offeramount']) == 1 else price_qu['name_plural']} \n"
             note += f"{fields['offerstore']}: {str(fields['offerfrom'])} - {str(fields['offerto'])}\n"
             note += f"{fields['offernote']}"
 
         sl_item["note"] = note
-        await self.grocy_api.update_shopping_list(sl_item)
+        await self.write_queue.update_shopping_list(sl_item)
 
     async def update_shopping_list_notes(self):
         self.logger.info("update grocy shopping lists notes.")
         start = time.time()
-        shopping_list = await self.grocy_api.get_shopping_list()
-        await asyncio.gather(*[self.__update_sl_item_notes(sl_item) for sl_item in shopping_list])
+        self.grocy_mirror.invalidate()
+        snapshot = await self.grocy_mirror.get_snapshot()
+        shopping_list = await self.grocy_mirror.get_shopping_list()
+        await asyncio.gather(*[self.__update_sl_item_notes(sl_item, snapshot) for sl_item in shopping_list])
+        await self.write_queue.flush()
         self.logger.info(f"Updated shopping list notes in in {time.time() - start}")
 
     async def clear_shopping_list_notes(self):
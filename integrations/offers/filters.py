@@ -1,21 +1,37 @@
 from grocy.index import GrocyIndex
-from offers.model import OfferFilter, Offer
+import numpy as np
+
+from offers.model import OfferFilter, Offer, OfferColumns
+from products.quantity.conversion_index import ConversionIndex
 
 
 class GrocyQuOfferFilter(OfferFilter):
-    def __init__(self, grocy_index: GrocyIndex, allowed_qus):
+    def __init__(self, grocy_index: GrocyIndex, conversion_index: ConversionIndex, product_id: int, to_qu_id: int):
         super().__init__()
         self.grocy_index = grocy_index
-        self.allowed_qus = allowed_qus
+        self.conversion_index = conversion_index
+        self.product_id = product_id
+        self.to_qu_id = to_qu_id
 
-    def filter(self, offer: Offer) -> bool:
-        grocy_qus = self.grocy_index.query_qu_index(offer.qu)
+    def get_factor(self, qu: str) -> float | None:
+        grocy_qus = self.grocy_index.query_qu_index(qu)
         if len(grocy_qus) < 1:
-            return False
+            return None
         grocy_qu = grocy_qus[0]
-        factor = self.allowed_qus.get(int(grocy_qu['id']), None)
+        return self.conversion_index.factor(self.product_id, int(grocy_qu['id']), self.to_qu_id)
+
+    def filter(self, offer: Offer) -> bool:
+        factor = self.get_factor(offer.qu)
         if factor is None:
             return False
         offer.price /= factor
         offer.reference_price /= factor
         return True
+
+    def mask(self, columns: OfferColumns) -> np.ndarray:
+        # The unit index is queried once per distinct unit instead of once per offer, missing factors become nan
+        factors = OfferColumns.lookup(columns.qus, columns.qu_codes, self.get_factor)
+        mask = ~np.isnan(factors)
+        columns.price[mask] /= factors[mask]
+        columns.reference_price[mask] /= factors[mask]
+        return mask
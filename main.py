@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 import time
 
@@ -12,6 +13,12 @@ from products import product_resource
 from recipes import recipe_resource
 from shopping_list import shopping_list_resource
 from stores import store_resource
+from utils.search.index import SearchIndex
+
+
+async def refresh_if_stale(search_index: SearchIndex, update, max_age: float = 900):
+    if search_index.count() == 0 or (time.time() - search_index.last_modified()) > max_age:
+        await update()
 
 
 def create_app() -> FastAPI:
@@ -22,11 +29,16 @@ def create_app() -> FastAPI:
     async def lifespan(app: FastAPI):
         await container.init_resources()
         grocy_index = await container.grocy_index()
-        if (time.time() - grocy_index.product_ix.last_modified()) > 900:
-            await grocy_index.update_product_index()
-        if (time.time() - grocy_index.qu_ix.last_modified()) > 900:
-            await grocy_index.update_qu_index()
+        markt_guru_service = await container.markt_guru_service()
+        # Serve from the persisted indexes right away and refresh stale ones in the background
+        warm_up = container.warm_up()
+        warm_up.add("products", lambda: refresh_if_stale(grocy_index.product_index, grocy_index.update_product_index))
+        warm_up.add("qus", lambda: refresh_if_stale(grocy_index.qu_index, grocy_index.update_qu_index))
+        warm_up.add("offers", markt_guru_service.refresh)
+        warm_up.add("offer records", lambda: asyncio.to_thread(markt_guru_service.get_records))
+        await warm_up.run()
         yield
+        await warm_up.cancel()
         # Clean up the ML models and release the resources
         await container.shutdown_resources()
 
@@ -1,7 +1,9 @@
 from datetime import date
 from typing import List
 
-from offers.model import OfferFilter, Offer
+import numpy as np
+
+from offers.model import OfferFilter, Offer, OfferColumns
 
 
 class SelectedStoresOfferFilter(OfferFilter):
@@ -12,27 +14,39 @@ class SelectedStoresOfferFilter(OfferFilter):
         else:
             self.accepted_stores = None
 
-    def filter(self, offer: Offer) -> bool:
+    def is_accepted(self, store_name: str) -> bool:
         if self.accepted_stores is None or len(self.accepted_stores) == 0:
             return True
         for store in self.accepted_stores:
-            if offer.store_name.lower().strip().find(store) != -1:
+            if store_name.lower().strip().find(store) != -1:
                 return True
         return False
 
+    def filter(self, offer: Offer) -> bool:
+        return self.is_accepted(offer.store_name)
+
+    def mask(self, columns: OfferColumns) -> np.ndarray:
+        return OfferColumns.lookup(columns.store_names, columns.store_codes, self.is_accepted, dtype=np.bool_)
+
 
 class BannedBrandsOfferFilter(OfferFilter):
     def __init__(self, banned_brands: List[str]):
         super().__init__()
         self.banned_brands = [brand.lower().strip() for brand in banned_brands]
 
-    def filter(self, offer: Offer) -> bool:
-        if offer.brand_name is None:
+    def is_accepted(self, brand_name: str | None) -> bool:
+        if brand_name is None:
             return True
-        if offer.brand_name.lower().strip() in self.banned_brands:
+        if brand_name.lower().strip() in self.banned_brands:
             return False
         return True
 
+    def filter(self, offer: Offer) -> bool:
+        return self.is_accepted(offer.brand_name)
+
+    def mask(self, columns: OfferColumns) -> np.ndarray:
+        return OfferColumns.lookup(columns.brand_names, columns.brand_codes, self.is_accepted, dtype=np.bool_)
+
 
 class TimeOfferFilter(OfferFilter):
     def __init__(self, time: date):
@@ -42,4 +56,10 @@ class TimeOfferFilter(OfferFilter):
     def filter(self, offer: Offer) -> bool:
         if self.time < offer.valid_from.date() or self.time > offer.valid_to.date():
             return False
-        return True
\ No newline at end of file
+        return True
+
+    def mask(self, columns: OfferColumns) -> np.ndarray:
+        time = np.datetime64(self.time, "D")
+        valid_from = columns.valid_from.astype("datetime64[D]")
+        valid_to = columns.valid_to.astype("datetime64[D]")
+        return (valid_from <= time) & (valid_to >= time)
\ No newline at end of file
@@ -1,45 +1,142 @@
 import logging
+import os
+import threading
 
-from tqdm import tqdm
-from whoosh import writing
 from whoosh.fields import Schema, TEXT, ID
-from whoosh.index import create_in, open_dir, exists_in
-from whoosh.qparser import MultifieldParser
 
+from offers.snapshots import OfferSnapshot
+from utils.search.backends import create_search_index, get_search_index_path, remove_search_index
+from utils.search.index import SearchIndex
+from utils.search.embedding import EmbeddingIndex, embed
+from utils.whoosh.lemmatizer import BulkLemmatizer, lemmatize_documents
 from utils.whoosh.tokenizers import LemmaTokenizer
 
 
+# Fields searched by queries
+FIELDS = ["product_name", "brand_name", "store_name", "category"]
+
+
 class OfferIndex:
-    def __init__(self):
+    """
+    Every refresh builds a new generation of the offer index from a copy of the live one, which is swapped in with
+    swap_offer_index once the offers that belong to it are ready. Searches see the live generation until then. The
+    previous generation is kept open for searches that started before the swap, older ones are deleted.
+    """
+
+    def __init__(self, lemmatize_processes: int | None = None, semantic_threshold: float | None = None,
+                 semantic_limit: int = 20, search_backend: str | None = None):
         self.logger = logging.getLogger('OfferIndex')
         self.my_analyser = LemmaTokenizer("de")
         # self.my_analyser = LanguageAnalyzer(lang='de')
+        self.lemmatizer = BulkLemmatizer(self.my_analyser, n_process=lemmatize_processes)
         self.offer_schema = Schema(product_name=TEXT(stored=True, analyzer=self.my_analyser, field_boost=2),
                                    store_name=TEXT(stored=True, analyzer=self.my_analyser),
                                    brand_name=TEXT(stored=True, analyzer=self.my_analyser, field_boost=2),
                                    category=TEXT(stored=True, analyzer=self.my_analyser, field_boost=3),
-                                   description=TEXT(stored=True, analyzer=self.my_analyser), id=ID(stored=True))
-        if exists_in("index/offers"):
-            self.offer_ix = open_dir("index/offers", schema=self.offer_schema)
-        else:
-            self.offer_ix = create_in("index/offers", self.offer_schema)
+                                   description=TEXT(stored=True, analyzer=self.my_analyser),
+                                   id=ID(stored=True, unique=True), hash=ID(stored=True))
+        self.search_backend = search_backend
+        # Number of the live generation, the index from before generations existed is generation 0
+        self.generation_path = get_search_index_path(search_backend, "offers") + ".generation"
+        self.generation = self.__read_generation()
+        self.offer_index = self.__open(self.generation)
+        self.previous_index: SearchIndex | None = None
+        self.swap_lock = threading.Lock()
+        self.semantic_threshold = semantic_threshold if semantic_threshold is not None else 0.7
+        self.semantic_limit = semantic_limit
+
+    @staticmethod
+    def __get_name(generation: int) -> str:
+        return "offers" if generation == 0 else f"offers.{generation}"
+
+    def __read_generation(self) -> int:
+        if not os.path.exists(self.generation_path):
+            return 0
+        with open(self.generation_path, "r") as fp:
+            return int(fp.read().strip())
+
+    def __write_generation(self, generation: int):
+        with open(self.generation_path + ".tmp", "w") as fp:
+            fp.write(str(generation))
+        os.replace(self.generation_path + ".tmp", self.generation_path)
 
-    def query_offer_index(self, product_text: str):
+    def __open(self, generation: int) -> SearchIndex:
+        return create_search_index(self.search_backend, self.__get_name(generation), self.offer_schema, FIELDS)
+
+    def __build_embedding_index(self, documents) -> EmbeddingIndex:
+        texts = [f"{document.get('product_name', '')} {document.get('category', '')}" for document in documents]
+        return EmbeddingIndex(documents, embed(self.my_analyser.nlp, texts))
+
+    def query_offer_semantic(self, product_text: str, offer_index: SearchIndex | None = None) -> list[dict]:
+        """
+        Match the text against the word vector embeddings of the offer product names and categories, for offers that
+        share no words with the text.
+        :param offer_index: generation to search, the live one by default
+        :return: up to semantic_limit offers with at least semantic_threshold cosine similarity, best first
+        """
+        offer_index = offer_index or self.offer_index
+        embedding_index = offer_index.get_derived("embedding index", self.__build_embedding_index)
+        results = embedding_index.search_many(embed(self.my_analyser.nlp, [product_text]), limit=self.semantic_limit,
+                                              threshold=self.semantic_threshold)[0]
+        return [dict(document) for document, _ in results]
+
+    def get_stats(self):
+        return {"offers": self.offer_index.get_stats(),
+                "lemmas": {"de": {"hits": self.my_analyser.lemma_table.hits,
+                                  "misses": self.my_analyser.lemma_table.misses}}}
+
+    def query_offer_index(self, product_text: str, offer_index: SearchIndex | None = None):
+        """
+        :param offer_index: generation to search, the live one by default
+        """
         self.logger.debug(f"Query: {product_text}")
-        with self.offer_ix.searcher() as searcher:
-            query_parser = MultifieldParser(["product_name", "brand_name", "store_name", "category"],
-                                            self.offer_ix.schema)
-            query = query_parser.parse(product_text)
-            results = searcher.search(query, limit=None)
-            return [dict(result) for result in results]
-
-    def update_offer_index(self, offers):
-        self.logger.info("Updating Index")
-        writer = self.offer_ix.writer()
-        for offer in tqdm(offers):
-            writer.add_document(product_name=str(offer['product']['name'].lower()),
-                                brand_name=str(offer['brand']['name']),
-                                store_name=str(", ".join([adv['name'] for adv in offer['advertisers']])),
-                                category=str(", ".join([cat['name'] for cat in offer['categories']])),
-                                description=str(offer['description']), id=str(offer['id']))
-        writer.commit(mergetype=writing.CLEAR)
+        offer_index = offer_index or self.offer_index
+        results = offer_index.search(product_text, limit=None)
+        if len(results) == 0:
+            results = self.query_offer_semantic(product_text, offer_index)
+        return results
+
+    def build_offer_index(self, snapshot: OfferSnapshot) -> SearchIndex:
+        """
+        Build the next generation of the index from a copy of the live one: add new offers, delete offers that are
+        gone and reindex offers whose text changed, unchanged offers are not lemmatized again. The live generation is
+        not changed.
+        :return: the new generation, to be swapped in with swap_offer_index
+        """
+        generation = self.generation + 1
+        name = self.__get_name(generation)
+        # Left over by a refresh that failed
+        remove_search_index(self.search_backend, name)
+        self.offer_index.copy_to(get_search_index_path(self.search_backend, name))
+        offer_index = self.__open(generation)
+        self.logger.info(f"Building offer index generation {generation}")
+        documents = {}
+        for offer_id, rows in snapshot.get_offers():
+            documents[str(offer_id)] = {"product_name": rows[0]["product_name"].lower(),
+                                        "brand_name": rows[0]["brand_name"],
+                                        "store_name": ", ".join([row["store_name"] for row in rows]),
+                                        "category": rows[0]["category"], "description": rows[0]["description"]}
+        # Store, brand and category names repeat across offers, they are lemmatized once
+        lemmatizers = {field: self.lemmatizer for field in
+                       ["product_name", "brand_name", "store_name", "category", "description"]}
+        try:
+            offer_index.sync(documents, prepare=lambda changed: lemmatize_documents(changed, lemmatizers))
+        except Exception:
+            offer_index.close()
+            remove_search_index(self.search_backend, name)
+            raise
+        return offer_index
+
+    def swap_offer_index(self, offer_index: SearchIndex):
+        """
+        Make a generation from build_offer_index the live one.
+        """
+        with self.swap_lock:
+            oldest, self.previous_index = self.previous_index, self.offer_index
+            self.offer_index = offer_index
+            self.generation += 1
+            self.__write_generation(self.generation)
+        if oldest is not None:
+            oldest.close()
+        if self.generation >= 2:
+            remove_search_index(self.search_backend, self.__get_name(self.generation - 2))
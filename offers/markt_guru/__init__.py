@@ -1,36 +1,97 @@
+import asyncio
+import json
+import logging
 import os
-from datetime import datetime
+import threading
 import time
 
 from deep_translator import GoogleTranslator
 
 from offers.index import OfferIndex
 from offers.markt_guru.api.markt_guru import MarktGuruAPI
+from offers.markt_guru.records import OfferRecords
 from offers.model import Offers, Offer
 from offers.services import OffersService
+from offers.snapshots import OfferSnapshot, OfferSnapshotStore, diff
+from utils.search.index import SearchIndex
 
-import json
+# Offers were stored as raw JSON before the snapshot store, they are converted once
+DEFAULT_LEGACY_OFFERS_PATH = "today_offers.json"
 
 
 class MarktGuruOffersService(OffersService):
-    def __init__(self, api: MarktGuruAPI, offer_index: OfferIndex):
+    def __init__(self, api: MarktGuruAPI, offer_index: OfferIndex, snapshot_store: OfferSnapshotStore,
+                 max_age: float | None = None, legacy_offers_path: str | None = None):
         super().__init__("MarktGuru")
+        self.logger = logging.getLogger("MarktGuruOffersService")
         self.api = api
         self.translator = GoogleTranslator(source='de', target='en')
         self.qus_cache = {}
         self.offer_index = offer_index
-        refresh_scheduled = time.time() - os.path.getmtime("today_offers.json") > 86400
-        if refresh_scheduled:
-            offers = self.api.get_all_offers()
-            self.offers = {offer['id']: offer for offer in offers}
-            self.offer_index.update_offer_index(offers)
-            with open("today_offers.json", "w") as fp:
-                json.dump(offers, fp)
-        else:
-            with open("today_offers.json", "r") as fp:
-                offers = json.load(fp)
-                self.offers = {offer['id']: offer for offer in offers}
-                # self.offer_index.update_product_index(offers)
+        self.snapshot_store = snapshot_store
+        self.max_age = max_age if max_age is not None else 86400
+        self.refresh_lock = asyncio.Lock()
+        self.last_refresh = {}
+        legacy_offers_path = legacy_offers_path if legacy_offers_path is not None else DEFAULT_LEGACY_OFFERS_PATH
+        if len(self.snapshot_store.get_days()) == 0 and os.path.exists(legacy_offers_path):
+            with open(legacy_offers_path, "r") as fp:
+                self.snapshot_store.save(OfferSnapshot.from_mg_offers(json.load(fp)))
+        # Serve the offers of the last refresh until refresh() downloads new ones in the background. The index
+        # generation, the snapshot and its records are swapped together, searches take all three from one state.
+        self.state: tuple[SearchIndex, OfferSnapshot | None, OfferRecords | None] = (
+            self.offer_index.offer_index, self.snapshot_store.load_latest(), None)
+        self.state_lock = threading.Lock()
+        self.records_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> OfferSnapshot | None:
+        return self.state[1]
+
+    def is_stale(self) -> bool:
+        age = self.snapshot_store.get_age()
+        return age is None or age > self.max_age
+
+    async def refresh(self, force: bool = False):
+        """
+        Refresh the offers if the latest snapshot is older than max_age seconds, in the stages fetch, normalize,
+        diff, index and persist. Requests are served from the previous snapshot until the new one is indexed and
+        swapped in. A refresh that is already running is not started again.
+        """
+        if self.refresh_lock.locked() or (not force and not self.is_stale()):
+            return
+        async with self.refresh_lock:
+            timings = {}
+            start = time.time()
+            mg_offers = await self.fetch()
+            timings["fetch"] = time.time() - start
+            start = time.time()
+            snapshot = await asyncio.to_thread(OfferSnapshot.from_mg_offers, mg_offers)
+            timings["normalize"] = time.time() - start
+            start = time.time()
+            changes = await asyncio.to_thread(diff, self.snapshot, snapshot)
+            timings["diff"] = time.time() - start
+            start = time.time()
+            # Only changed offers are lemmatized and written, into a new generation that searches don't see yet
+            offer_index = await asyncio.to_thread(self.offer_index.build_offer_index, snapshot)
+            timings["index"] = time.time() - start
+            start = time.time()
+            await asyncio.to_thread(self.snapshot_store.save, snapshot)
+            timings["persist"] = time.time() - start
+            snapshot = self.snapshot_store.load_latest()
+            records = await asyncio.to_thread(OfferRecords, snapshot, self.name, self.get_qu)
+            # Swap in the new index generation with the memory-mapped new snapshot and its records in one step
+            with self.state_lock:
+                self.state = (offer_index, snapshot, records)
+            await asyncio.to_thread(self.offer_index.swap_offer_index, offer_index)
+            self.last_refresh = {"finished": time.time(), "offers": len(snapshot), "timings": timings,
+                                 **{change: len(keys) for change, keys in changes.items()}}
+            self.logger.info(f"Refreshed offers: {self.last_refresh}")
+
+    async def fetch(self) -> list[dict]:
+        return [mg_offer async for mg_offer in self.api.stream_all_offers()]
+
+    def get_stats(self):
+        return {"offers": len(self.snapshot) if self.snapshot is not None else 0, "last_refresh": self.last_refresh}
 
     def get_qu(self, qu_name):
         qu = self.qus_cache.get(qu_name, None)
@@ -40,36 +101,34 @@ class MarktGuruOffersService(OffersService):
         self.qus_cache[qu_name] = qu
         return qu
 
-    def map_offer(self, mg_offer):
-        # Fix reference price if it is None
-        if mg_offer["referencePrice"] is None:
-            mg_offer["referencePrice"] = mg_offer["price"]
-        for i in range(0, len(mg_offer["advertisers"])):
-            advertiser = mg_offer["advertisers"][i]
-            validity_dates = mg_offer["validityDates"][i]
-            image_url = f"https://mg2de.b-cdn.net/api/v1/offers/{mg_offer['id']}/images/default/0/medium.webp"
-            source_url = f"https://www.marktguru.de/offers/{mg_offer['id']}"
-            brand_name = mg_offer["brand"]["name"]
-            if brand_name == "thisisnobrand123":
-                brand_name = None
-            offer = Offer(
-                id=str(mg_offer['id']),
-                source_name=self.name,
-                product_name=mg_offer["product"]["name"],
-                brand_name=brand_name, store_name=advertiser["name"],
-                price=mg_offer["price"],
-                reference_price=mg_offer["referencePrice"], qu=self.get_qu(mg_offer["unit"]["shortName"]),
-                valid_from=datetime.strptime(validity_dates["from"], "%Y-%m-%dT%H:%M:%SZ"),
-                valid_to=datetime.strptime(validity_dates["to"], "%Y-%m-%dT%H:%M:%SZ"),
-                requires_membership=mg_offer["requiresLoyalityMembership"], image_url=image_url,
-                source_url=source_url, description=mg_offer["description"])
-            yield offer
+    def get_state(self) -> tuple[SearchIndex, OfferRecords | None]:
+        """
+        :return: the live index generation and the materialized offers of its snapshot, built on first use after
+                 startup
+        """
+        with self.state_lock:
+            offer_index, snapshot, records = self.state
+        if snapshot is None or records is not None:
+            return offer_index, records
+        # Building the records translates units over the network, so it only holds the build lock and swaps are not
+        # blocked. They are published only if no refresh swapped in another snapshot in the meantime.
+        with self.records_lock:
+            with self.state_lock:
+                offer_index, snapshot, records = self.state
+            if snapshot is not None and records is None:
+                records = OfferRecords(snapshot, self.name, self.get_qu)
+                with self.state_lock:
+                    if self.state[1] is snapshot and self.state[2] is None:
+                        self.state = (self.state[0], snapshot, records)
+                    offer_index, _, records = self.state
+        return offer_index, records
+
+    def get_records(self) -> OfferRecords | None:
+        return self.get_state()[1]
 
     def search(self, query: str) -> Offers:
-        idx_results = self.offer_index.query_offer_index(query)
-        offers = []
-        for idx_result in idx_results:
-            mg_offer = self.offers[int(idx_result['id'])]
-            for offer in self.map_offer(mg_offer):
-                offers.append(offer)
-        return Offers(offers)
+        offer_index, records = self.get_state()
+        if records is None:
+            return Offers([])
+        offer_ids = [int(idx_result['id']) for idx_result in self.offer_index.query_offer_index(query, offer_index)]
+        return Offers(columns=records.take(offer_ids))
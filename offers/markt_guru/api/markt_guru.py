@@ -1,61 +1,82 @@
+import asyncio
 import logging
+from typing import AsyncIterator, Awaitable, Callable
 
-import requests
+from aiohttp import ClientSession
 
-from api.api import API
+from utils.scheduler import RequestScheduler, READ
 
 
-class MarktGuruAPI(API):
-    def __init__(self, host: str, port: int, api_key: str, client_key: str, zip_code: int):
-        super().__init__(host, port)
+class MarktGuruAPI:
+    """
+    Async MarktGuru client. The first page of a listing returns the total number of results, the remaining pages are
+    then requested concurrently, limited and retried by the scheduler, over the keep-alive connections of the session.
+    Results are yielded as their pages arrive.
+    """
+
+    def __init__(self, session: ClientSession, zip_code: int, scheduler: RequestScheduler | None = None):
         self.logger = logging.getLogger("MarktGuruAPI")
-        self.api_key = api_key
-        self.client_key = client_key
+        self.session = session
         self.zip_code = zip_code
+        if scheduler is None:
+            scheduler = RequestScheduler("MarktGuruAPI")
+        self.scheduler = scheduler
 
-    def get_url(self):
-        url = super().get_url()
-        url += '/api/v1'
-        return url
+    def get_stats(self):
+        return self.scheduler.get_stats()
 
-    def get_headers(self):
-        return {"x-clientkey": self.client_key, "x-apikey": self.api_key}
+    async def _request(self, url, params):
+        async with self.session.get(url, params=params) as r:
+            if r.status >= 500:
+                r.raise_for_status()
+            return await r.json()
 
-    def search_offers(self, query):
-        self.logger.info(f"getting all offers for \"{query}\".")
-        response = self.search_offers_paged(query)
-        num_results = len(response["results"])
-        offset = 24
-        while num_results < response["totalResults"]:
-            new_response = self.search_offers_paged(query, offset=offset)
-            response["results"] += new_response["results"]
-            offset += 24
-            num_results += len(new_response["results"])
-        return response["results"]
+    async def _read(self, url, params):
+        return await self.scheduler.run(READ, lambda: self._request(url, params))
+
+    async def _stream_pages(self, get_page: Callable[[int], Awaitable[dict]], page_size: int) -> AsyncIterator[dict]:
+        """
+        Yield the results of all pages, the first page in order, the following pages in the order they arrive.
+        Results that moved between pages while paging are yielded once.
+        """
+        response = await get_page(0)
+        seen = set()
+        for result in response["results"]:
+            seen.add(result["id"])
+            yield result
+        pages = [asyncio.create_task(get_page(offset))
+                 for offset in range(page_size, response["totalResults"], page_size)]
+        try:
+            for page in asyncio.as_completed(pages):
+                for result in (await page)["results"]:
+                    if result["id"] not in seen:
+                        seen.add(result["id"])
+                        yield result
+        finally:
+            for page in pages:
+                page.cancel()
 
     def search_offers_paged(self, query, limit=24, offset=0):
-        self.logger.info(f"getting {limit} offers for \"{query}\" on page {offset/limit}.")
-        url = self.get_url() + "/offers/search"
+        self.logger.debug(f"getting {limit} offers for \"{query}\" on page {offset / limit}.")
         params = {"as": "web", "limit": limit, "offset": offset, "q": query, "zipCode": self.zip_code}
-        response = requests.get(url=url, headers=self.get_headers(), params=params)
-        return response.json()
+        return self._read("/api/v1/offers/search", params)
+
+    def stream_search_offers(self, query, page_size=24) -> AsyncIterator[dict]:
+        self.logger.info(f"getting all offers for \"{query}\".")
+        return self._stream_pages(lambda offset: self.search_offers_paged(query, limit=page_size, offset=offset),
+                                  page_size)
+
+    async def search_offers(self, query):
+        return [offer async for offer in self.stream_search_offers(query)]
 
     def get_offers_paged(self, limit=500, offset=0):
-        self.logger.info(f"getting {limit} offers for page {offset/limit}.")
-        url = self.get_url() + "/offers"
+        self.logger.debug(f"getting {limit} offers for page {offset / limit}.")
         params = {"as": "web", "limit": limit, "offset": offset, "zipCode": self.zip_code}
-        response = requests.get(url=url, headers=self.get_headers(), params=params)
-        return response.json()
+        return self._read("/api/v1/offers", params)
 
-    def get_all_offers(self):
+    def stream_all_offers(self, page_size=500) -> AsyncIterator[dict]:
         self.logger.info("getting all offers.")
-        page_size = 500
-        response = self.get_offers_paged(limit=page_size)
-        num_results = len(response["results"])
-        offset = page_size
-        while num_results < response["totalResults"]:
-            new_response = self.get_offers_paged(offset=offset, limit=page_size)
-            response["results"] += new_response["results"]
-            offset += page_size
-            num_results += len(new_response["results"])
-        return response["results"]
+        return self._stream_pages(lambda offset: self.get_offers_paged(limit=page_size, offset=offset), page_size)
+
+    async def get_all_offers(self):
+        return [offer async for offer in self.stream_all_offers()]
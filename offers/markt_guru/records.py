@@ -0,0 +1,55 @@
+from typing import Callable
+
+import numpy as np
+
+from offers.model import Offer, OfferColumns
+from offers.snapshots import OfferSnapshot
+
+
+class OfferRecords:
+    """
+    All offers of a snapshot materialized once, with parsed validity dates, translated units and their URLs, and their
+    columns. Repeated strings like store, brand and unit names are shared between the records. Searches take the rows
+    of the offers they found out of the columns, the records are only copied for the offers that are ranked on top.
+    """
+
+    def __init__(self, snapshot: OfferSnapshot, source_name: str, translate_qu: Callable[[str], str]):
+        self.snapshot = snapshot
+        columns = {name: column.tolist() for name, column in snapshot.columns.items()}
+        columns.update({name: column.tolist() for name, column in snapshot.strings.items()})
+        qus = {qu: translate_qu(qu) for qu in set(columns["qu"])}
+        strings = {}
+        offers = []
+        # The rows of every advertiser of an offer id
+        self.rows: dict[int, list[int]] = {}
+        for row in range(len(snapshot)):
+            offer_id = columns["id"][row]
+            brand_name = columns["brand_name"][row]
+            if brand_name in ["thisisnobrand123", ""]:
+                brand_name = None
+            # Snapshots store missing descriptions as empty strings
+            description = columns["description"][row] or None
+            offer = Offer(id=str(offer_id), source_name=source_name,
+                          product_name=strings.setdefault(columns["product_name"][row], columns["product_name"][row]),
+                          brand_name=strings.setdefault(brand_name, brand_name),
+                          store_name=strings.setdefault(columns["store_name"][row], columns["store_name"][row]),
+                          price=columns["price"][row], reference_price=columns["reference_price"][row],
+                          qu=qus[columns["qu"][row]], valid_from=columns["valid_from"][row],
+                          valid_to=columns["valid_to"][row], requires_membership=columns["requires_membership"][row],
+                          image_url=f"https://mg2de.b-cdn.net/api/v1/offers/{offer_id}/images/default/0/medium.webp",
+                          source_url=f"https://www.marktguru.de/offers/{offer_id}",
+                          description=strings.setdefault(description, description))
+            self.rows.setdefault(offer_id, []).append(row)
+            offers.append(offer)
+        self.columns = OfferColumns.from_offers(offers)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def take(self, offer_ids: list[int]) -> OfferColumns:
+        """
+        :return: the columns of every advertiser of the offers in the given order, offers that are not in the snapshot
+                 are skipped
+        """
+        rows = [row for offer_id in offer_ids for row in self.rows.get(offer_id, [])]
+        return self.columns.take(np.array(rows, dtype=np.int64))
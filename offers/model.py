@@ -1,10 +1,17 @@
 import abc
 import datetime
+import math
 from abc import ABC
 from typing import List, Callable, Any
 
+import numpy as np
+
 
 class Offer:
+    __slots__ = ["id", "source_name", "product_name", "brand_name", "store_name", "price", "reference_price", "qu",
+                 "valid_from", "valid_to", "requires_membership", "image_url", "source_url", "description",
+                 "preferences"]
+
     def __init__(self, id: str, source_name: str, product_name: str, brand_name: str, store_name: str, price: float,
                  reference_price: float, qu: str, valid_from: datetime.datetime, valid_to: datetime.datetime,
                  requires_membership: bool, image_url: str, source_url: str, description: str):
@@ -24,6 +31,16 @@ class Offer:
         self.description = description
         self.preferences = {}
 
+    def copy(self) -> "Offer":
+        """
+        :return: a copy without preferences, filters change the prices of the offers they see
+        """
+        offer = Offer.__new__(Offer)
+        for name in Offer.__slots__:
+            setattr(offer, name, getattr(self, name))
+        offer.preferences = {}
+        return offer
+
     def get_name(self) -> str:
         note = ""
         if self.brand_name is not None:
@@ -32,6 +49,85 @@ class Offer:
         return note
 
 
+def encode(values: list) -> tuple[list, np.ndarray]:
+    """
+    :return: the distinct values in order of appearance and the code of every value
+    """
+    table = {}
+    codes = np.fromiter((table.setdefault(value, len(table)) for value in values), dtype=np.int64, count=len(values))
+    return list(table), codes
+
+
+class OfferColumns:
+    """
+    Offers as numpy columns, store, brand and unit names dictionary encoded. Filters and preferences evaluate a
+    function once per distinct name and look the results up by code.
+    """
+
+    def __init__(self, offers: np.ndarray, store_names: list[str], store_codes: np.ndarray, brand_names: list,
+                 brand_codes: np.ndarray, qus: list[str], qu_codes: np.ndarray, valid_from: np.ndarray,
+                 valid_to: np.ndarray, price: np.ndarray, reference_price: np.ndarray):
+        self.offers = offers
+        self.store_names = store_names
+        self.store_codes = store_codes
+        self.brand_names = brand_names
+        self.brand_codes = brand_codes
+        self.qus = qus
+        self.qu_codes = qu_codes
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.price = price
+        self.reference_price = reference_price
+
+    @staticmethod
+    def from_offers(offers: list[Offer]) -> "OfferColumns":
+        store_names, store_codes = encode([offer.store_name for offer in offers])
+        brand_names, brand_codes = encode([offer.brand_name for offer in offers])
+        qus, qu_codes = encode([offer.qu for offer in offers])
+        offer_array = np.empty(len(offers), dtype=object)
+        offer_array[:] = offers
+        return OfferColumns(offer_array, store_names, store_codes, brand_names, brand_codes, qus, qu_codes,
+                            np.array([offer.valid_from for offer in offers], dtype="datetime64[s]"),
+                            np.array([offer.valid_to for offer in offers], dtype="datetime64[s]"),
+                            np.array([offer.price for offer in offers], dtype=np.float64),
+                            np.array([offer.reference_price for offer in offers], dtype=np.float64))
+
+    def __len__(self):
+        return len(self.offers)
+
+    def take(self, rows: np.ndarray) -> "OfferColumns":
+        """
+        :return: the given rows, e.g. the candidates of one product out of the columns of the whole catalog. Prices
+        are copies, filters may change them.
+        """
+        return OfferColumns(self.offers[rows], self.store_names, self.store_codes[rows], self.brand_names,
+                            self.brand_codes[rows], self.qus, self.qu_codes[rows], self.valid_from[rows],
+                            self.valid_to[rows], self.price[rows], self.reference_price[rows])
+
+    @staticmethod
+    def concat(first: "OfferColumns", second: "OfferColumns") -> "OfferColumns":
+        """
+        :return: the rows of both columns, the names of the second are appended to the names of the first
+        """
+        return OfferColumns(np.concatenate([first.offers, second.offers]), first.store_names + second.store_names,
+                            np.concatenate([first.store_codes, second.store_codes + len(first.store_names)]),
+                            first.brand_names + second.brand_names,
+                            np.concatenate([first.brand_codes, second.brand_codes + len(first.brand_names)]),
+                            first.qus + second.qus, np.concatenate([first.qu_codes, second.qu_codes + len(first.qus)]),
+                            np.concatenate([first.valid_from, second.valid_from]),
+                            np.concatenate([first.valid_to, second.valid_to]),
+                            np.concatenate([first.price, second.price]),
+                            np.concatenate([first.reference_price, second.reference_price]))
+
+    @staticmethod
+    def lookup(values: list, codes: np.ndarray, function: Callable[[Any], Any], dtype=np.float64) -> np.ndarray:
+        """
+        :return: the function of every distinct value, looked up for every row
+        """
+        return np.array([function(value) for value in values], dtype=dtype)[codes] if len(values) > 0 \
+            else np.zeros(len(codes), dtype=dtype)
+
+
 class OfferFilter(ABC):
     def __init__(self):
         pass
@@ -43,6 +139,13 @@ class OfferFilter(ABC):
     def __call__(self, *args, **kwargs):
         self.filter(*args, **kwargs)
 
+    def mask(self, columns: OfferColumns) -> np.ndarray:
+        """
+        Vectorized filter, falls back to filter for every offer.
+        :return: True for every row that passes
+        """
+        return np.fromiter((self.filter(offer) for offer in columns.offers), dtype=np.bool_, count=len(columns))
+
 
 class OfferPreference:
     def __init__(self):
@@ -54,13 +157,74 @@ class OfferPreference:
     def get_preference_name(self):
         pass
 
+    def get_preferences(self, columns: OfferColumns) -> np.ndarray:
+        """
+        Vectorized preference, falls back to get_preference for every offer.
+        :return: the preference of every row
+        """
+        return np.array([self.get_preference(offer) for offer in columns.offers], dtype=np.float64)
+
+
+def rank(columns: OfferColumns, filters: List[OfferFilter], preferences: List[OfferPreference], order: List[str],
+         k: int = 1, reverse: bool = False) -> list[Offer]:
+    """
+    Filter the offers with masks and return the top k by the order keys, without sorting all offers. Filters may
+    change the prices of the columns, columns built once for many calls are passed with take. The returned offers
+    are copies with the prices changed by filters and the preferences.
+    :param order: names of preferences or of the price and reference_price columns, compared in this order
+    """
+    mask = np.ones(len(columns), dtype=np.bool_)
+    for f in filters:
+        mask &= f.mask(columns)
+    values = {preference.get_preference_name(): preference.get_preferences(columns) for preference in preferences}
+    values.update(price=columns.price, reference_price=columns.reference_price)
+    candidates = np.flatnonzero(mask)
+    if len(candidates) == 0 or k < 1:
+        return []
+    # Dense ranks of every key and their number of distinct values, ties are broken by position like a stable sort
+    ranks = []
+    sizes = []
+    for key in order:
+        _, key_ranks = np.unique(values[key][candidates], return_inverse=True)
+        key_ranks = key_ranks.reshape(-1)
+        sizes.append(int(key_ranks.max()) + 1)
+        ranks.append(-key_ranks if reverse else key_ranks)
+    positions = np.arange(len(candidates))
+    if math.prod(sizes) * len(candidates) <= np.iinfo(np.int64).max:
+        # Lexicographic order of the keys as one integer score, so it can be partitioned
+        score = np.zeros(len(candidates), dtype=np.int64)
+        for key_ranks, size in zip(ranks, sizes):
+            score = score * size + key_ranks
+        score = score * len(candidates) + positions
+        top = positions
+        if k < len(candidates):
+            top = np.argpartition(score, k - 1)[:k]
+        top = top[np.argsort(score[top])]
+    else:
+        # The score would overflow int64, sort all candidates by the keys instead
+        top = np.lexsort([positions] + ranks[::-1])[:k]
+    offers = []
+    for row in candidates[top]:
+        offer = columns.offers[row].copy()
+        offer.price = float(columns.price[row])
+        offer.reference_price = float(columns.reference_price[row])
+        for preference in preferences:
+            offer.preferences[preference.get_preference_name()] = float(values[preference.get_preference_name()][row])
+        offers.append(offer)
+    return offers
+
 
 class Offers:
     def __init__(self, offers: List[Offer] = None, filters: List[OfferFilter] = None,
-                 preferences: List[OfferPreference] = None):
+                 preferences: List[OfferPreference] = None, columns: OfferColumns | None = None):
+        """
+        :param columns: offers taken out of columns built once, e.g. for a whole snapshot. Their records are shared
+                        and only copied when they are ranked or the final offers are materialized.
+        """
         if offers is None:
             offers = []
         self.offers = offers
+        self.columns = columns
         if filters is None:
             filters = []
         self.filters = filters
@@ -69,12 +233,17 @@ class Offers:
         self.preferences = preferences
         self.sort_key = None
         self.sort_reverse = False
+        self.rank_order = None
 
     def append(self, offer: Offer):
         self.offers.append(offer)
 
     def join(self, offers):
         self.offers.extend(offers.offers)
+        if self.columns is None:
+            self.columns = offers.columns
+        elif offers.columns is not None:
+            self.columns = OfferColumns.concat(self.columns, offers.columns)
         self.filters.extend(offers.filters)
 
     def add_filter(self, new_filter: OfferFilter):
@@ -87,8 +256,30 @@ class Offers:
         self.sort_key = key
         self.sort_reverse = reverse
 
+    def set_rank_order(self, keys: List[str], reverse: bool = False):
+        """
+        Order by preference names and price columns, the top offers are then found with the vectorized filters and
+        preferences instead of sorting all offers.
+        """
+        self.rank_order = keys
+        self.sort_reverse = reverse
+
+    def get_columns(self) -> OfferColumns:
+        if self.columns is None:
+            return OfferColumns.from_offers(self.offers)
+        if len(self.offers) == 0:
+            return self.columns
+        return OfferColumns.concat(self.columns, OfferColumns.from_offers(self.offers))
+
+    def get_top_offers(self, k: int) -> list[Offer]:
+        return rank(self.get_columns(), self.filters, self.preferences, self.rank_order, k=k,
+                    reverse=self.sort_reverse)
+
     def get_final_offers(self) -> list[Offer]:
         result = self.offers
+        if self.columns is not None:
+            # Filters change the prices of the offers they see, the shared records are copied first
+            result = [offer.copy() for offer in self.columns.offers] + result
         for offer in result:
             for preference in self.preferences:
                 offer.preferences[preference.get_preference_name()] = preference.get_preference(offer)
@@ -101,7 +292,10 @@ class Offers:
         return result
 
     def get_top_offer(self) -> Offer | None:
-        offers = self.get_final_offers()
+        if self.rank_order is not None:
+            offers = self.get_top_offers(1)
+        else:
+            offers = self.get_final_offers()
         if len(offers) > 0:
             return offers[0]
         return None
@@ -1,6 +1,8 @@
 from typing import List, Dict
 
-from offers.model import OfferPreference, Offer
+import numpy as np
+
+from offers.model import OfferPreference, Offer, OfferColumns
 
 
 class BrandOfferPreference(OfferPreference):
@@ -13,10 +15,16 @@ class BrandOfferPreference(OfferPreference):
         else:
             raise Exception("invalid type of preferred_brands. Allowed types List[str] and Dict[str,float]")
 
-    def get_preference(self, offer: Offer) -> float:
-        if offer.brand_name is None:
+    def get_brand_preference(self, brand_name: str | None) -> float:
+        if brand_name is None:
             return 2.0
-        return self.preferred_brands.get(offer.brand_name.lower().strip(), 2.0)
+        return self.preferred_brands.get(brand_name.lower().strip(), 2.0)
+
+    def get_preference(self, offer: Offer) -> float:
+        return self.get_brand_preference(offer.brand_name)
+
+    def get_preferences(self, columns: OfferColumns) -> np.ndarray:
+        return OfferColumns.lookup(columns.brand_names, columns.brand_codes, self.get_brand_preference)
 
     def get_preference_name(self):
         return "brand"
@@ -0,0 +1,220 @@
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime
+from typing import Iterator
+
+import numpy as np
+
+# Columns with one value per (offer, advertiser) row
+NUMERIC_COLUMNS = {"id": np.int64, "price": np.float64, "reference_price": np.float64,
+                   "valid_from": "datetime64[s]", "valid_to": "datetime64[s]", "requires_membership": np.bool_}
+STRING_COLUMNS = ["product_name", "brand_name", "store_name", "qu", "description", "category"]
+
+
+class StringColumn:
+    """
+    Strings as one utf-8 buffer and the offsets of every string in it, so a column is two flat arrays that can be
+    memory-mapped.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    @staticmethod
+    def from_strings(strings: list[str]) -> "StringColumn":
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return StringColumn(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def tolist(self) -> list[str]:
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def save(self, path: str, name: str):
+        np.save(os.path.join(path, f"{name}.offsets.npy"), self.offsets)
+        np.save(os.path.join(path, f"{name}.data.npy"), self.data)
+
+    @staticmethod
+    def load(path: str, name: str, mmap_mode: str | None = "r") -> "StringColumn":
+        return StringColumn(np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode=mmap_mode),
+                            np.load(os.path.join(path, f"{name}.data.npy"), mmap_mode=mmap_mode))
+
+
+class OfferSnapshot:
+    """
+    The offer fields that are used for indexing and matching, one row per offer and advertiser, sorted by offer id
+    and validity start. Rows of an offer are found by binary search on the id column.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], strings: dict[str, StringColumn]):
+        self.columns = columns
+        self.strings = strings
+
+    @staticmethod
+    def from_mg_offers(mg_offers: list[dict]) -> "OfferSnapshot":
+        rows = []
+        for mg_offer in mg_offers:
+            category = ", ".join([category['name'] for category in mg_offer['categories']])
+            for advertiser, validity_dates in zip(mg_offer["advertisers"], mg_offer["validityDates"]):
+                reference_price = mg_offer["referencePrice"]
+                rows.append({"id": mg_offer['id'], "price": mg_offer["price"],
+                             "reference_price": reference_price if reference_price is not None else mg_offer["price"],
+                             "valid_from": validity_dates["from"].rstrip("Z"),
+                             "valid_to": validity_dates["to"].rstrip("Z"),
+                             "requires_membership": mg_offer["requiresLoyalityMembership"],
+                             "product_name": mg_offer["product"]["name"],
+                             "brand_name": mg_offer["brand"]["name"] or "", "store_name": advertiser["name"],
+                             "qu": mg_offer["unit"]["shortName"],
+                             "description": mg_offer["description"] or "", "category": category})
+        rows.sort(key=lambda row: (row["id"], row["valid_from"]))
+        columns = {name: np.array([row[name] for row in rows], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        strings = {name: StringColumn.from_strings([row[name] for row in rows]) for name in STRING_COLUMNS}
+        return OfferSnapshot(columns, strings)
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def get_ids(self) -> np.ndarray:
+        return np.unique(self.columns["id"])
+
+    def get_row(self, row: int) -> dict:
+        values = {name: column[row] for name, column in self.columns.items()}
+        values["id"] = int(values["id"])
+        values["price"] = float(values["price"])
+        values["reference_price"] = float(values["reference_price"])
+        values["requires_membership"] = bool(values["requires_membership"])
+        values["valid_from"] = values["valid_from"].astype(datetime)
+        values["valid_to"] = values["valid_to"].astype(datetime)
+        values.update({name: column[row] for name, column in self.strings.items()})
+        return values
+
+    def __get_range(self, offer_id: int) -> tuple[int, int]:
+        ids = self.columns["id"]
+        return int(np.searchsorted(ids, offer_id, side="left")), int(np.searchsorted(ids, offer_id, side="right"))
+
+    def get_rows(self, offer_id: int) -> list[dict]:
+        """
+        :return: rows of every advertiser of the offer, empty if the offer is not in the snapshot
+        """
+        start, end = self.__get_range(offer_id)
+        return [self.get_row(row) for row in range(start, end)]
+
+    def get_offers(self) -> Iterator[tuple[int, list[dict]]]:
+        """
+        :return: id and rows of every offer
+        """
+        ids = self.columns["id"]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) > 0 else np.zeros(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(ids)]
+        for start, end in zip(starts, ends):
+            yield int(ids[start]), [self.get_row(row) for row in range(start, end)]
+
+    def get_fingerprints(self) -> dict[int, int]:
+        """
+        :return: hash of the rows of every offer, equal for offers with equal rows
+        """
+        columns = [column.tolist() for column in self.columns.values()]
+        columns += [column.tolist() for column in self.strings.values()]
+        rows = {}
+        for row in zip(*columns):
+            rows.setdefault(row[0], []).append(row)
+        return {offer_id: hash(tuple(offer_rows)) for offer_id, offer_rows in rows.items()}
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name, column in self.columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column)
+        for name, column in self.strings.items():
+            column.save(path, name)
+
+    @staticmethod
+    def load(path: str, mmap_mode: str | None = "r") -> "OfferSnapshot":
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in NUMERIC_COLUMNS}
+        strings = {name: StringColumn.load(path, name, mmap_mode=mmap_mode) for name in STRING_COLUMNS}
+        return OfferSnapshot(columns, strings)
+
+
+def diff(old: OfferSnapshot | None, new: OfferSnapshot) -> dict[str, list[int]]:
+    """
+    :return: ids of the added, changed and removed offers
+    """
+    old_fingerprints = old.get_fingerprints() if old is not None else {}
+    new_fingerprints = new.get_fingerprints()
+    return {"added": list(new_fingerprints.keys() - old_fingerprints.keys()),
+            "changed": [offer_id for offer_id in new_fingerprints.keys() & old_fingerprints.keys()
+                        if new_fingerprints[offer_id] != old_fingerprints[offer_id]],
+            "removed": list(old_fingerprints.keys() - new_fingerprints.keys())}
+
+
+class OfferSnapshotStore:
+    """
+    One snapshot directory per day below path, the snapshots of the last retention_days days are kept. A snapshot
+    is written to a temporary directory and renamed into place, readers never see a partial snapshot. Snapshots are
+    loaded memory-mapped, the previous one stays readable while it is still mapped.
+    """
+
+    def __init__(self, path: str | None = None, retention_days: int | None = None):
+        self.logger = logging.getLogger("OfferSnapshotStore")
+        self.path = path if path is not None else "data/offers"
+        self.retention_days = retention_days if retention_days is not None else 7
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_days(self) -> list[date]:
+        days = []
+        for name in os.listdir(self.path):
+            try:
+                days.append(date.fromisoformat(name))
+            except ValueError:
+                pass
+        return sorted(days)
+
+    def __get_path(self, day: date) -> str:
+        return os.path.join(self.path, day.isoformat())
+
+    def get_age(self) -> float | None:
+        """
+        :return: seconds since the latest snapshot was saved, None without snapshots
+        """
+        days = self.get_days()
+        if len(days) == 0:
+            return None
+        return time.time() - os.path.getmtime(self.__get_path(days[-1]))
+
+    def load(self, day: date) -> OfferSnapshot:
+        return OfferSnapshot.load(self.__get_path(day))
+
+    def load_latest(self) -> OfferSnapshot | None:
+        days = self.get_days()
+        if len(days) == 0:
+            return None
+        return self.load(days[-1])
+
+    def save(self, snapshot: OfferSnapshot, day: date | None = None):
+        day = day or date.today()
+        path = self.__get_path(day)
+        shutil.rmtree(path + ".tmp", ignore_errors=True)
+        snapshot.save(path + ".tmp")
+        if os.path.exists(path):
+            shutil.rmtree(path + ".old", ignore_errors=True)
+            os.replace(path, path + ".old")
+        os.replace(path + ".tmp", path)
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        self.logger.info(f"Saved {len(snapshot)} offer rows to {path}")
+        self.prune()
+
+    def prune(self):
+        days = self.get_days()
+        for day in days[:max(len(days) - self.retention_days, 0)]:
+            shutil.rmtree(self.__get_path(day))
+            self.logger.info(f"Removed offer snapshot of {day}")
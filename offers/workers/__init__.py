@@ -0,0 +1,13 @@
+from datetime import timedelta
+
+from offers.markt_guru import MarktGuruOffersService
+from utils.workers import ScheduledWorker
+
+
+class OfferRefreshWorker(ScheduledWorker):
+    def __init__(self, offers_service: MarktGuruOffersService, period: timedelta = timedelta(hours=1)):
+        super().__init__(period, "OfferRefreshWorker")
+        self.offers_service = offers_service
+
+    async def run_once(self):
+        await self.offers_service.refresh()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, PositiveFloat, NonNegativeFloat
+from pydantic import BaseModel, Field, PositiveFloat, NonNegativeFloat, PrivateAttr
 
 
 class Unit(BaseModel):
@@ -30,9 +30,11 @@ class ProductDetails(Product):
     purchase_unit: Unit
     consume_unit: Unit
     price_unit: Unit
+    _conversion_map: dict[int, Conversion] | None = PrivateAttr(default=None)
 
     def get_conversion(self, from_qu_id: int):
-        for c in self.conversions:
-            if c.from_unit.id == from_qu_id:
-                return c
-        return None
\ No newline at end of file
+        if self._conversion_map is None:
+            self._conversion_map = {}
+            for c in self.conversions:
+                self._conversion_map.setdefault(c.from_unit.id, c)
+        return self._conversion_map.get(from_qu_id)
\ No newline at end of file
@@ -6,7 +6,7 @@ from fastapi.params import Depends
 
 from containers import Container
 from grocy import GrocyProductUpdateHandler
-from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
 from products.model import Product, ProductDetails
 from products.services import ProductService
 
@@ -15,9 +15,10 @@ router = APIRouter()
 
 @router.get("/update")
 @inject
-async def index(grocy_api: GrocyAPI = Depends(Provide[Container.grocy_api]),
+async def index(grocy_mirror: GrocyMirror = Depends(Provide[Container.grocy_mirror]),
                 product_updater: GrocyProductUpdateHandler = Depends(Provide[Container.product_updater])):
-    products = await grocy_api.get_products()
+    grocy_mirror.invalidate()
+    products = await grocy_mirror.get_products()
     await asyncio.gather(*[product_updater.update(product) for product in products])
     return {"message": "Products update successfully!"}
 
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class ConversionIndex:
+    """
+    Quantity unit conversions of all products with integer coded products and units. The conversion factors are kept
+    in one contiguous array sorted by (product, from unit, to unit), so all conversions of a product are adjacent.
+    Single factors are looked up in O(1), whole arrays of amounts are converted with vectorized lookups. Converting a
+    unit to itself always has the factor 1.
+    """
+
+    def __init__(self, conversions):
+        conversions = [c for c in conversions if c['product_id'] is not None]
+        self.product_ids = np.unique(np.array([c['product_id'] for c in conversions], dtype=np.int64))
+        self.qu_ids = np.unique(np.array([c['from_qu_id'] for c in conversions] +
+                                         [c['to_qu_id'] for c in conversions], dtype=np.int64))
+        self.product_codes = {int(product_id): code for code, product_id in enumerate(self.product_ids)}
+        self.qu_codes = {int(qu_id): code for code, qu_id in enumerate(self.qu_ids)}
+        self.num_qus = len(self.qu_ids)
+
+        keys = np.array([self.__key(self.product_codes[c['product_id']], self.qu_codes[c['from_qu_id']],
+                                    self.qu_codes[c['to_qu_id']]) for c in conversions], dtype=np.int64)
+        factors = np.array([c['factor'] for c in conversions], dtype=np.float64)
+        keys, first = np.unique(keys, return_index=True)
+        self.keys = keys
+        self.factors = factors[first]
+        self.positions = {int(key): position for position, key in enumerate(self.keys)}
+        # conversions of product code p are self.keys[self.offsets[p]:self.offsets[p + 1]]
+        self.offsets = np.searchsorted(self.keys, np.arange(len(self.product_ids) + 1) * self.num_qus * self.num_qus)
+
+    def __key(self, product_code, from_code, to_code):
+        return (product_code * self.num_qus + from_code) * self.num_qus + to_code
+
+    def __len__(self):
+        return len(self.keys)
+
+    def factor(self, product_id: int, from_qu_id: int, to_qu_id: int) -> float | None:
+        """
+        :return: factor converting an amount of from_qu_id to to_qu_id for the product, None if there is no conversion
+        """
+        if from_qu_id == to_qu_id:
+            return 1.0
+        product_code = self.product_codes.get(product_id)
+        from_code = self.qu_codes.get(from_qu_id)
+        to_code = self.qu_codes.get(to_qu_id)
+        if product_code is None or from_code is None or to_code is None:
+            return None
+        position = self.positions.get(self.__key(product_code, from_code, to_code))
+        if position is None:
+            return None
+        return float(self.factors[position])
+
+    @staticmethod
+    def __encode(ids, values: np.ndarray):
+        codes = np.searchsorted(values, ids)
+        clipped = np.minimum(codes, max(len(values) - 1, 0))
+        found = (codes < len(values)) & (values[clipped] == ids) if len(values) > 0 else np.zeros(len(ids), bool)
+        return clipped, found
+
+    def factors_for(self, product_ids, from_qu_ids, to_qu_ids) -> np.ndarray:
+        """
+        Vectorized factor lookup.
+        :return: array of factors, NaN where the product has no such conversion
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        from_qu_ids = np.asarray(from_qu_ids, dtype=np.int64)
+        to_qu_ids = np.asarray(to_qu_ids, dtype=np.int64)
+        product_codes, product_found = self.__encode(product_ids, self.product_ids)
+        from_codes, from_found = self.__encode(from_qu_ids, self.qu_ids)
+        to_codes, to_found = self.__encode(to_qu_ids, self.qu_ids)
+        keys = self.__key(product_codes, from_codes, to_codes)
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = product_found & from_found & to_found
+        if len(self.keys) > 0:
+            found &= self.keys[positions] == keys
+            result = np.where(found, self.factors[positions], np.nan)
+        else:
+            result = np.full(len(keys), np.nan)
+        result[from_qu_ids == to_qu_ids] = 1.0
+        return result
+
+    def convert(self, product_ids, amounts, from_qu_ids, to_qu_ids) -> np.ndarray:
+        """
+        Vectorized conversion of amounts.
+        :return: converted amounts, NaN where the product has no such conversion
+        """
+        return np.asarray(amounts, dtype=np.float64) * self.factors_for(product_ids, from_qu_ids, to_qu_ids)
+
+    def conversions_to(self, product_id: int, to_qu_id: int) -> dict[int, float]:
+        """
+        :return: factors of all units of the product that convert to to_qu_id, keyed by the from unit id
+        """
+        result = {to_qu_id: 1.0}
+        product_code = self.product_codes.get(product_id)
+        to_code = self.qu_codes.get(to_qu_id)
+        if product_code is None or to_code is None:
+            return result
+        start, end = self.offsets[product_code], self.offsets[product_code + 1]
+        keys = self.keys[start:end]
+        matches = np.flatnonzero(keys % self.num_qus == to_code)
+        from_codes = (keys[matches] // self.num_qus) % self.num_qus
+        for from_code, factor in zip(from_codes, self.factors[start:end][matches]):
+            result[int(self.qu_ids[from_code])] = float(factor)
+        return result
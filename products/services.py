@@ -3,6 +3,7 @@ from abc import ABCMeta, abstractmethod
 from functools import lru_cache
 
 from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror, GrocySnapshot
 from grocy.index import GrocyIndex
 from products.model import Product, Conversion, Unit, ProductDetails
 
@@ -25,9 +26,10 @@ class ProductService(metaclass=ABCMeta):
 
 
 class GrocyProductService(ProductService):
-    def __init__(self, grocy_api: GrocyAPI, grocy_index: GrocyIndex):
+    def __init__(self, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror, grocy_index: GrocyIndex):
         self.grocy_index = grocy_index
         self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
 
     def map_product(self, product_details, conversions):
         product = product_details['product']
@@ -63,23 +65,28 @@ class GrocyProductService(ProductService):
                               stock_amount=product_details['stock_amount'], average_price=product_details['avg_price'],
                               last_price=product_details['last_price'])
 
+    @staticmethod
+    def get_conversions(snapshot: GrocySnapshot, product_id: int, to_qu_id: int):
+        conversions = snapshot.get_conversion_index().conversions_to(product_id, to_qu_id)
+        to_qu = snapshot.qus_by_id[to_qu_id]
+        return [{"from_qu_id": from_qu_id, "from_qu_name": snapshot.qus_by_id[from_qu_id]['name'],
+                 "to_qu_id": to_qu_id, "to_qu_name": to_qu['name'], "factor": factor} for from_qu_id, factor in
+                conversions.items()]
+
     async def get_product(self, product_id: int, stock_qu_id: int | None = None) -> ProductDetails:
-        if stock_qu_id is not None:
-            product_details, conversions = await asyncio.gather(self.grocy_api.get_product_details(product_id),
-                                                                self.grocy_api.get_product_conversions(
-                                                                    product_id=product_id, to_qu_id=stock_qu_id))
-        else:
-            product_details = await self.grocy_api.get_product_details(product_id)
-            product = product_details['product']
-            conversions = await self.grocy_api.get_product_conversions(product_id=product_id,
-                                                                       to_qu_id=product['qu_id_stock'])
+        product_details, snapshot = await asyncio.gather(self.grocy_api.get_product_details(product_id),
+                                                         self.grocy_mirror.get_snapshot())
+        if stock_qu_id is None:
+            stock_qu_id = product_details['product']['qu_id_stock']
+        conversions = self.get_conversions(snapshot, product_id, stock_qu_id)
         return self.map_product(product_details, conversions)
 
     async def get_products(self) -> list[Product]:
-        return await self.grocy_api.get_products()  # products, conversions = self.grocy_api.get_product_with_conversions()  # product_models = []  # for product in tqdm(products):  #     product_details = self.grocy_api.get_product_details(product_id=product['id'])  #     product_model = self.map_product(product_details, conversions[product['id']])  #     product_models.append(product_model)  # return product_models
+        return await self.grocy_mirror.get_products()  # products, conversions = self.grocy_api.get_product_with_conversions()  # product_models = []  # for product in tqdm(products):  #     product_details = self.grocy_api.get_product_details(product_id=product['id'])  #     product_model = self.map_product(product_details, conversions[product['id']])  #     product_models.append(product_model)  # return product_models
 
     async def set_min_stock_amount_to_zero(self):
-        products = await self.grocy_api.get_products()
+        self.grocy_mirror.invalidate()
+        products = await self.grocy_mirror.get_products()
         products_to_update = []
 
         for product in products:
@@ -8,6 +8,7 @@ from pydantic_core import Url
 
 from api.images.model import ImageFromUrl
 from grocy.api.grocy_api import GrocyAPI, RECIPE_PICTURES
+from grocy.api.grocy_mirror import GrocyMirror
 from grocy.index import GrocyIndex
 from products.model import Unit
 from products.services import ProductService
@@ -17,21 +18,41 @@ re_float = re.compile(r"[+-]?(\d+)(\.\d+)?")
 
 
 class RecipeService:
-    def __init__(self, scrape_recipe, grocy_index: GrocyIndex, grocy_api: GrocyAPI, product_service: ProductService):
+    def __init__(self, scrape_recipe, grocy_index: GrocyIndex, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror,
+                 product_service: ProductService):
         self.logger = logging.getLogger("RecipeService")
         self.scrape_recipe = scrape_recipe
         self.grocy_index = grocy_index
         self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
         self.product_service = product_service
 
     async def parse_ingredient(self, text: str) -> Ingredient:
-        parsed_ingredient = parse_ingredient(text)
-        if parsed_ingredient.name is None:
-            raise Exception(f"Ingredient cannot be created. {text}, {parsed_ingredient}")
+        return (await self.parse_ingredients([text]))[0]
 
+    async def parse_ingredients(self, texts: list[str]) -> list[Ingredient]:
+        """
+        Parse the ingredients and match all their products and units with one batch query per index.
+        """
+        parsed_ingredients = []
+        for text in texts:
+            parsed_ingredient = parse_ingredient(text)
+            if parsed_ingredient.name is None:
+                raise Exception(f"Ingredient cannot be created. {text}, {parsed_ingredient}")
+            parsed_ingredients.append(parsed_ingredient)
+
+        product_names = [parsed_ingredient.name.text for parsed_ingredient in parsed_ingredients]
+        units = [p.amount[0].unit for p in parsed_ingredients
+                 if len(p.amount) > 0 and p.amount[0].unit is not None and len(p.amount[0].unit) > 0]
+        products = self.grocy_index.query_product_index_many(product_names)
+        qus_by_unit = dict(zip(units, self.grocy_index.query_qu_index_many(units)))
+        return list(await asyncio.gather(
+            *[self.__get_ingredient(text, parsed_ingredient, result, qus_by_unit)
+              for text, parsed_ingredient, result in zip(texts, parsed_ingredients, products)]))
+
+    async def __get_ingredient(self, text: str, parsed_ingredient, result: list[dict],
+                               qus_by_unit: dict[str, list[dict]]) -> Ingredient:
         # Product
-        product_name = parsed_ingredient.name.text
-        result = self.grocy_index.query_product_index(product_name)
         product = None
         if len(result) > 0:
             product = await self.product_service.get_product(result[0]['id'])
@@ -43,7 +64,7 @@ class RecipeService:
             amount = parsed_ingredient.amount[0]
             # Unit
             if amount.unit is not None and len(amount.unit) > 0:
-                result = self.grocy_index.query_qu_index(amount.unit)
+                result = qus_by_unit[amount.unit]
                 if len(result) > 0:
                     quantity_unit = Unit(name=result[0]['name'], id=int(result[0]['id']))
             elif product is not None:
@@ -220,8 +241,7 @@ class RecipeService:
 
         url = Url(schema_recipe['url'])
         recipe_yield = self.__get_recipe_yield(schema_recipe)
-        ingredients = list(await asyncio.gather(
-            *[self.parse_ingredient(text) for text in self.__get_ingredients_strings(schema_recipe)]))
+        ingredients = await self.parse_ingredients(self.__get_ingredients_strings(schema_recipe))
         name = schema_recipe['name']
         description = self.get_url_html(schema_recipe) + self.get_keywords_html(schema_recipe) + self.get_category_html(
             schema_recipe) + self.get_cuisine_html(schema_recipe) + self.get_time_html(
@@ -239,6 +259,16 @@ class RecipeService:
         return recipe
 
     async def save_recipe(self, recipe: NewRecipeRequest) -> int:
+        # Conversions are checked before anything is written, so an unsupported unit does not leave a partial recipe
+        conversion_index = await self.grocy_mirror.get_conversion_index()
+        factors = []
+        for ingredient in recipe.ingredients:
+            factor = conversion_index.factor(ingredient.product.id, ingredient.quantity_unit_id,
+                                             ingredient.product.stock_unit.id)
+            if factor is None:
+                raise Exception("Unsupported conversions for the product")
+            factors.append(factor)
+
         grocy_recipe = {}
 
         grocy_recipe["description"] = recipe.description
@@ -255,7 +285,7 @@ class RecipeService:
         recipe_id = created_recipe['created_object_id']
 
         grocy_ingredients = []
-        for ingredient in recipe.ingredients:
+        for ingredient, factor in zip(recipe.ingredients, factors):
             grocy_ingredient = {}
             grocy_ingredient['price_factor'] = 1
             grocy_ingredient['only_check_single_unit_in_stock'] = 0
@@ -265,7 +295,7 @@ class RecipeService:
             grocy_ingredient['note'] = ingredient.note
             grocy_ingredient['group'] = ingredient.group
             grocy_ingredient['recipe_id'] = recipe_id
-            grocy_ingredient['amount'] = ingredient.product.get_conversion(ingredient.quantity_unit_id).factor * ingredient.quantity_amount
+            grocy_ingredient['amount'] = factor * ingredient.quantity_amount
             grocy_ingredients.append(grocy_ingredient)
 
         await asyncio.gather(*[self.grocy_api.add_recipe_ingredient(i) for i in grocy_ingredients])
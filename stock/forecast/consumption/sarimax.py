@@ -7,19 +7,18 @@ from statsmodels.tsa.arima.model import ARIMA, ARIMAResults
 from statsmodels.tsa.stattools import adfuller
 from tqdm import tqdm
 
-from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
+from stock.log.store import StockLogStore
 
 
 class SARIMAXConsumptionForecaster:
-    def __init__(self, grocy_api: GrocyAPI):
-        self.grocy_api = grocy_api
+    def __init__(self, grocy_mirror: GrocyMirror, stock_log: StockLogStore):
+        self.grocy_mirror = grocy_mirror
+        self.stock_log = stock_log
 
     async def __get_log_df(self):
-        consumption_log = await self.grocy_api.get_consumption_log()
-        df = pd.DataFrame.from_dict(consumption_log, orient='columns')
-        df['row_created_timestamp'] = pd.to_datetime(df['row_created_timestamp'])
-        df['spoiled'] = df['spoiled'].astype(bool)
-        df['undone'] = df['undone'].astype(bool)
+        await self.stock_log.sync()
+        df = self.stock_log.load_df(transaction_types=["consume"], undone=False, spoiled=False)
         df = df.sort_values(by='row_created_timestamp')
         df = df.set_index('row_created_timestamp')
         df['consumption'] = df['amount'] * (-1)
@@ -68,7 +67,7 @@ class SARIMAXConsumptionForecaster:
         model.save(f"models/forecast/consumption/{product['id']}.pickle")
 
     async def create_models(self):
-        products, log_df = await asyncio.gather(self.grocy_api.get_products(), self.__get_log_df())
+        products, log_df = await asyncio.gather(self.grocy_mirror.get_products(), self.__get_log_df())
         for index, product in tqdm(enumerate(products)):
             self.__fit_model(log_df, product, index)
 
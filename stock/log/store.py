@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_sqlite import GrocySQLiteReader
+from utils.json_stream import ColumnBuilder
+
+TRANSACTION_TYPES = ["purchase", "consume", "inventory-correction", "product-opened", "stock-edit-old",
+                     "stock-edit-new", "self-production", "transfer_from", "transfer_to"]
+
+COLUMNS = {
+    "id": np.int64,
+    "product_id": np.int64,
+    "amount": np.float64,
+    "price": np.float64,
+    "transaction_type": np.int8,
+    "undone": np.bool_,
+    "spoiled": np.bool_,
+    "location_id": np.int64,
+    "shopping_location_id": np.int64,
+    "row_created_timestamp": "datetime64[s]"
+}
+
+
+def _column_value(column: str, value):
+    if column == "transaction_type":
+        return TRANSACTION_TYPES.index(value) if value in TRANSACTION_TYPES else -1
+    if value is None:
+        if column in ["price", "amount"]:
+            return np.nan
+        if column == "row_created_timestamp":
+            return "NaT"
+        return -1
+    if column in ["undone", "spoiled"]:
+        return bool(int(value))
+    return value
+
+
+def build_columns(rows) -> dict[str, np.ndarray]:
+    builder = ColumnBuilder(COLUMNS, converter=_column_value)
+    builder.extend(rows)
+    return builder.build()
+
+
+class StockLogStore:
+    """
+    Local copy of the Grocy stock_log with all transaction types, stored as one .npy file per column so it can be
+    memory mapped. Only rows with an id above the last synced id are downloaded, the last resync_ids ids are
+    downloaded again because undoing a transaction changes existing rows.
+    """
+
+    def __init__(self, grocy_api: GrocyAPI | GrocySQLiteReader, path: str = "data/stock_log", resync_ids: int = 1000):
+        self.logger = logging.getLogger("StockLogStore")
+        self.grocy_api = grocy_api
+        self.path = path
+        self.resync_ids = resync_ids
+        self.lock = asyncio.Lock()
+
+    def __get_meta_path(self, path: str):
+        return os.path.join(path, "meta.json")
+
+    def last_id(self) -> int:
+        meta_path = self.__get_meta_path(self.path)
+        if not os.path.exists(meta_path):
+            return 0
+        with open(meta_path, "r") as fp:
+            return json.load(fp)["last_id"]
+
+    def load(self) -> dict[str, np.ndarray]:
+        """
+        :return: memory mapped columns of the stored log sorted by id, empty columns if nothing is synced yet
+        """
+        if not os.path.exists(self.__get_meta_path(self.path)):
+            return build_columns([])
+        return {column: np.load(os.path.join(self.path, f"{column}.npy"), mmap_mode="r") for column in COLUMNS}
+
+    def load_df(self, transaction_types: list[str] | None = None, undone: bool | None = None,
+                spoiled: bool | None = None) -> pd.DataFrame:
+        """
+        Load the log into a DataFrame.
+        :param transaction_types: keep only these transaction types, all if None
+        :param undone: keep only undone (True) or not undone (False) rows, all if None
+        :param spoiled: keep only spoiled (True) or not spoiled (False) rows, all if None
+        :return:
+        """
+        columns = self.load()
+        mask = np.ones(len(columns["id"]), dtype=bool)
+        if transaction_types is not None:
+            mask &= np.isin(columns["transaction_type"], [TRANSACTION_TYPES.index(t) for t in transaction_types])
+        if undone is not None:
+            mask &= columns["undone"] == undone
+        if spoiled is not None:
+            mask &= columns["spoiled"] == spoiled
+        df = pd.DataFrame({column: values[mask] for column, values in columns.items()})
+        df["transaction_type"] = pd.Categorical.from_codes(df["transaction_type"], categories=TRANSACTION_TYPES)
+        return df
+
+    def __save(self, columns: dict[str, np.ndarray]):
+        new_path = self.path + ".new"
+        old_path = self.path + ".old"
+        shutil.rmtree(new_path, ignore_errors=True)
+        os.makedirs(new_path)
+        for column, values in columns.items():
+            np.save(os.path.join(new_path, f"{column}.npy"), values)
+        last_id = int(columns["id"][-1]) if len(columns["id"]) > 0 else 0
+        with open(self.__get_meta_path(new_path), "w") as fp:
+            json.dump({"last_id": last_id, "rows": len(columns["id"]), "synced": time.time()}, fp)
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(new_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    async def sync(self) -> int:
+        """
+        Download the new rows of the stock log and merge them into the store.
+        :return: number of downloaded rows
+        """
+        async with self.lock:
+            start = time.time()
+            min_id = max(self.last_id() - self.resync_ids, 0)
+            builder = ColumnBuilder(COLUMNS, converter=_column_value)
+            async for row in self.grocy_api.stream_stock_log(min_id=min_id):
+                builder.append(row)
+            if builder.rows == 0:
+                return 0
+            new_columns = builder.build()
+            columns = self.load()
+            keep = ~np.isin(columns["id"], new_columns["id"])
+            merged = {column: np.concatenate([columns[column][keep], new_columns[column]]) for column in COLUMNS}
+            order = np.argsort(merged["id"], kind="stable")
+            self.__save({column: values[order] for column, values in merged.items()})
+            self.logger.info(f"Synced {builder.rows} stock log rows after id {min_id} in {time.time() - start}")
+            return builder.rows
@@ -6,6 +6,7 @@ from datetime import date
 from lidlplus import LidlPlusApi
 
 from grocy.api.grocy_api import GrocyAPI
+from grocy.api.grocy_mirror import GrocyMirror
 from grocy.index import GrocyIndex
 from products.data.model import ProductKey, ProductKeyType, ProductDataSource
 from products.services import ProductService
@@ -62,11 +63,12 @@ class StoreService(metaclass=ABCMeta):
 
 
 class GrocyStoreService(StoreService):
-    def __init__(self, grocy_api: GrocyAPI, grocy_index: GrocyIndex, lidl_api: LidlPlusApi,
+    def __init__(self, grocy_api: GrocyAPI, grocy_mirror: GrocyMirror, grocy_index: GrocyIndex, lidl_api: LidlPlusApi,
                  product_db: ProductDataSource, product_service: ProductService, lidl_counter: LidlCounter,
                  kaufland_counter: KauflandCounter, netto_counter: NettoCounter, rewe_counter: ReweCounter):
         self.grocy_index = grocy_index
         self.grocy_api = grocy_api
+        self.grocy_mirror = grocy_mirror
         self.lidl_api = lidl_api
         self.product_db = product_db
         self.product_service = product_service
@@ -78,14 +80,14 @@ class GrocyStoreService(StoreService):
         }
 
     async def get_stores(self, can_fetch_receipts=False) -> list[Store]:
-        stores = await self.grocy_api.get_stores()
+        stores = await self.grocy_mirror.get_stores()
         print(self.counters.keys())
         if can_fetch_receipts:
             stores = [store for store in stores if store['id'] in self.counters.keys()]
         return stores
 
     async def get_store(self, store_id: int) -> Store:
-        return await self.grocy_api.get_store(store_id)
+        return await self.grocy_mirror.get_store(store_id)
 
     async def get_receipts(self, store_id: int) -> list[Receipt]:
         counter = self.counters[store_id]
@@ -93,59 +95,56 @@ class GrocyStoreService(StoreService):
             raise Exception("Store API for fetching receipts not supported")
         return await counter.get_receipts()
 
-    async def __get_model(self, item: ReceiptItem, purchase_date: date, store_id: int):
+    async def __lookup_item(self, item: ReceiptItem, products_by_note: dict[str, list[dict]]):
+        """
+        Find the Grocy barcode of the item, the products matched by its name or the product data used to search the
+        product.
+        :param products_by_note: products matched by the notes of the items without barcode
+        :return: note extended with the product data name, Grocy barcode, product data, products matched by the name
+        """
+        note = item.note
+        if item.barcode is not None:
+            grocy_barcode = await self.grocy_api.get_barcode(item.barcode)
+            if grocy_barcode is not None:
+                return note, grocy_barcode, None, None
+            product_key = ProductKey(key_type=ProductKeyType.BARCODE, key=item.barcode)
+        else:
+            # Names that match a product are not looked up in the slow product database
+            grocy_products = products_by_note[note]
+            if len(grocy_products) > 0:
+                return note, None, None, grocy_products
+            product_key = ProductKey(key_type=ProductKeyType.PRODUCT_NAME, key=note)
+        product_data = self.product_db.get_data(product_key)
+        if product_data.has_name():
+            note += " / " + product_data.name[0].entry_value
+        return note, None, product_data, None
+
+    async def __get_model(self, item: ReceiptItem, purchase_date: date, store_id: int, note: str, grocy_barcode,
+                          product_data, grocy_products: list[dict], qus_by_text: dict[str, list[dict]]):
         selected_unit: Unit | None = None
         if item.quantity_unit is not None:
-            qus = self.grocy_index.query_qu_index(item.quantity_unit.lower())
+            qus = qus_by_text[item.quantity_unit.lower()]
             if len(qus) >= 1:
                 selected_unit = Unit(id=qus[0]['id'], name=qus[0]['name'])
         selected_product: ProductDetails | None = None
         selected_quantity: float | None = item.quantity_amount
         due_date = None
-        note = item.note
         barcode = item.barcode
-        if barcode is not None:
-            grocy_barcode = await self.grocy_api.get_barcode(barcode)
-            if grocy_barcode is not None:
-                selected_product = await self.product_service.get_product(grocy_barcode['product_id'])
-                conversion = selected_product.get_conversion(from_qu_id=grocy_barcode['qu_id'])
-                selected_unit = selected_product.stock_unit
-                if grocy_barcode['amount'] is not None:
-                    selected_quantity = grocy_barcode['amount'] * conversion.factor
-                if grocy_barcode['note'] is not None:
-                    note = grocy_barcode['note']
-            else:
-                product_key = ProductKey(key_type=ProductKeyType.BARCODE, key=barcode)
-                product_data = self.product_db.get_data(product_key)
-                if product_data.has_name():
-                    note += " / " + product_data.name[0].entry_value
-
-                grocy_products = self.grocy_index.query_product_index(note)
-
-                if len(grocy_products) > 0:
-                    product = grocy_products[0]
-                    selected_product = await self.product_service.get_product(int(product['id']))
-
-                if product_data.has_qu() and product_data.has_quantity_amount():
-                    qus = self.grocy_index.query_qu_index(product_data.qu[0].entry_value)
-                    if len(qus) > 0:
-                        selected_unit = Unit.model_validate(qus[0])
-                        selected_quantity = product_data.quantity_amount[0].entry_value
+        if grocy_barcode is not None:
+            selected_product = await self.product_service.get_product(grocy_barcode['product_id'])
+            conversion = selected_product.get_conversion(from_qu_id=grocy_barcode['qu_id'])
+            selected_unit = selected_product.stock_unit
+            if grocy_barcode['amount'] is not None:
+                selected_quantity = grocy_barcode['amount'] * conversion.factor
+            if grocy_barcode['note'] is not None:
+                note = grocy_barcode['note']
         else:
-            product_key = ProductKey(key_type=ProductKeyType.PRODUCT_NAME, key=note)
-            product_data = self.product_db.get_data(product_key)
-
-            if product_data.has_name():
-                note += " / " + product_data.name[0].entry_value
-
-            grocy_products = self.grocy_index.query_product_index(note)
-
             if len(grocy_products) > 0:
                 product = grocy_products[0]
                 selected_product = await self.product_service.get_product(int(product['id']))
 
-            if product_data.has_qu() and product_data.has_quantity_amount():
-                qus = self.grocy_index.query_qu_index(product_data.qu[0].entry_value)
+            if product_data is not None and product_data.has_qu() and product_data.has_quantity_amount():
+                qus = qus_by_text[product_data.qu[0].entry_value]
                 if len(qus) > 0:
                     selected_unit = Unit.model_validate(qus[0])
                     selected_quantity = product_data.quantity_amount[0].entry_value
@@ -173,22 +172,43 @@ class GrocyStoreService(StoreService):
         ticket = await counter.get_receipt_details(receipt_id)
         receipt = ReceiptPurchaseModel(id=ticket.id, location=ticket.location, currency=ticket.currency,
                                        total_amount=ticket.total_amount, transaction_time=ticket.transaction_time)
+        # Receipt names are matched first, with the fuzzy and semantic fallbacks of the index for abbreviated names
+        notes = [item.note for item in ticket.items if item.barcode is None]
+        products_by_note = dict(zip(notes, self.grocy_index.query_product_index_many(notes)))
+        lookups = await asyncio.gather(*[self.__lookup_item(item, products_by_note) for item in ticket.items])
+
+        # Match the remaining items with the product data names in one batch query per index
+        product_texts = [note for note, grocy_barcode, _, grocy_products in lookups
+                         if grocy_barcode is None and grocy_products is None]
+        qu_texts = [item.quantity_unit.lower() for item in ticket.items if item.quantity_unit is not None]
+        qu_texts += [product_data.qu[0].entry_value for _, _, product_data, _ in lookups
+                     if product_data is not None and product_data.has_qu() and product_data.has_quantity_amount()]
+        products_by_text = dict(zip(product_texts, self.grocy_index.query_product_index_many(product_texts)))
+        qus_by_text = dict(zip(qu_texts, self.grocy_index.query_qu_index_many(qu_texts)))
+
         receipt.items = await asyncio.gather(
-            *[self.__get_model(item, ticket.transaction_time.date(), store_id) for item in ticket.items])
+            *[self.__get_model(item, ticket.transaction_time.date(), store_id, note, grocy_barcode, product_data,
+                               grocy_products if grocy_products is not None else products_by_text.get(note, []),
+                               qus_by_text)
+              for item, (note, grocy_barcode, product_data, grocy_products) in zip(ticket.items, lookups)])
         return receipt
 
     async def purchase(self, purchase_request: PurchaseRequestModel):
-        product_details = await self.product_service.get_product(purchase_request.product_id)
-        conv = product_details.get_conversion(purchase_request.quantity_unit_id)
-
-        if conv is None:
+        product, conversion_index = await asyncio.gather(self.grocy_mirror.get_product(purchase_request.product_id),
+                                                         self.grocy_mirror.get_conversion_index())
+        if product is None:
+            raise Exception(f"Product with {purchase_request.product_id} not found.")
+        factor = conversion_index.factor(purchase_request.product_id, purchase_request.quantity_unit_id,
+                                         product['qu_id_stock'])
+
+        if factor is None:
             raise Exception("Unsupported conversions for the product")
 
-        amount = float(purchase_request.quantity_amount) * conv.factor * float(purchase_request.quantity_multiplier)
+        amount = float(purchase_request.quantity_amount) * factor * float(purchase_request.quantity_multiplier)
         price = float(purchase_request.price) / amount
 
         if purchase_request.barcode is not None:
-            barcode = self.grocy_api.get_barcode(purchase_request.barcode)
+            barcode = await self.grocy_api.get_barcode(purchase_request.barcode)
             if barcode is None:
                 await self.grocy_api.create_barcode(
                     {"product_id": purchase_request.product_id, "barcode": purchase_request.barcode,
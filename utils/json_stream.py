@@ -0,0 +1,144 @@
+import json
+import re
+from typing import Callable, Iterable
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STRUCTURE = re.compile(rb'[\[\]{}",]')
+STRING_END = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+
+def get_loads(backend: str | None = None) -> Callable:
+    """
+    :param backend: "orjson" or "json", orjson if it is installed and no backend is given
+    :return: function decoding JSON from bytes or str
+    """
+    if backend is None:
+        backend = "orjson" if orjson is not None else "json"
+    if backend == "orjson":
+        if orjson is None:
+            raise Exception("orjson JSON backend requested but the orjson package is not installed.")
+        return orjson.loads
+    if backend == "json":
+        return json.loads
+    raise Exception(f"Unknown JSON backend {backend}. Allowed backends orjson and json")
+
+
+class JsonArrayDecoder:
+    """
+    Incremental decoder for a top level JSON array. Chunks of the document are fed as they arrive and every complete
+    element is decoded on its own, so only one element and the undecoded rest of the current chunk are buffered.
+    """
+
+    def __init__(self, loads: Callable = None):
+        self.loads = loads if loads is not None else get_loads()
+        self.buffer = bytearray()
+        self.pos = 0
+        self.start = 0
+        self.depth = 0
+        self.in_string = False
+        self.finished = False
+
+    def __emit(self, end: int, items: list):
+        value = bytes(self.buffer[self.start:end]).strip()
+        if len(value) > 0:
+            items.append(self.loads(value))
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        :param chunk: next part of the document
+        :return: the elements completed by this chunk
+        """
+        self.buffer += chunk
+        buffer = self.buffer
+        items = []
+        i = self.pos
+        while not self.finished:
+            if self.in_string:
+                match = STRING_END.match(buffer, i)
+                if match is None:
+                    break
+                i = match.end()
+                self.in_string = False
+                continue
+            match = STRUCTURE.search(buffer, i)
+            if match is None:
+                i = len(buffer)
+                break
+            i = match.start()
+            c = buffer[i]
+            if c == ord('"'):
+                self.in_string = True
+            elif c == ord('[') or c == ord('{'):
+                if self.depth == 0:
+                    if c != ord('['):
+                        raise ValueError(f"Expected a JSON array but got {bytes(buffer[i:i + 200])}")
+                    self.start = i + 1
+                self.depth += 1
+            elif c == ord(']') or c == ord('}'):
+                self.depth -= 1
+                if self.depth == 1:
+                    self.__emit(i + 1, items)
+                    self.start = i + 1
+                elif self.depth == 0:
+                    self.__emit(i, items)
+                    self.finished = True
+            elif self.depth == 1:
+                self.__emit(i, items)
+                self.start = i + 1
+            i += 1
+        # Drop everything that was already decoded
+        if self.depth > 0 and self.start > 0:
+            del buffer[:self.start]
+            i -= self.start
+            self.start = 0
+        self.pos = i
+        return items
+
+    def close(self):
+        if not self.finished:
+            raise ValueError("JSON array ended before it was closed.")
+
+
+class ColumnBuilder:
+    """
+    Collects rows into numpy columns. Values are converted to arrays every chunk_size rows, so the rows themselves
+    don't have to be kept in memory.
+    """
+
+    def __init__(self, columns: dict, converter: Callable[[str, object], object] | None = None,
+                 chunk_size: int = 10000):
+        self.columns = columns
+        self.converter = converter
+        self.chunk_size = chunk_size
+        self.values = {column: [] for column in columns}
+        self.chunks = {column: [] for column in columns}
+        self.rows = 0
+
+    def __flush(self):
+        for column, dtype in self.columns.items():
+            self.chunks[column].append(np.array(self.values[column], dtype=dtype))
+            self.values[column] = []
+
+    def append(self, row):
+        for column, values in self.values.items():
+            value = row.get(column)
+            if self.converter is not None:
+                value = self.converter(column, value)
+            values.append(value)
+        self.rows += 1
+        if self.rows % self.chunk_size == 0:
+            self.__flush()
+
+    def extend(self, rows: Iterable):
+        for row in rows:
+            self.append(row)
+
+    def build(self) -> dict[str, np.ndarray]:
+        self.__flush()
+        return {column: np.concatenate(chunks) for column, chunks in self.chunks.items()}
@@ -0,0 +1,51 @@
+import logging
+import threading
+import time
+
+import spacy
+from spacy.language import Language
+
+logger = logging.getLogger("NLP")
+
+MODELS = {"de": "de_core_news_md", "en": "en_core_web_sm"}
+# Lemmas, stop words and punctuation don't need the dependency parser or the entity recognizer
+DISABLED_COMPONENTS = ["parser", "ner", "senter"]
+
+_lock = threading.Lock()
+_models: dict[str, Language] = {}
+_model_names = dict(MODELS)
+_disabled = list(DISABLED_COMPONENTS)
+
+
+def configure(models: dict[str, str] | None = None, disable: list[str] | None = None):
+    """
+    Set the spaCy model of each language and the pipeline components that are not loaded. Only affects models that
+    are not loaded yet.
+    """
+    global _disabled
+    with _lock:
+        if models is not None:
+            _model_names.update(models)
+        if disable is not None:
+            _disabled = list(disable)
+
+
+def get_nlp(lang: str = "en") -> Language:
+    """
+    :return: the process-wide spaCy model of the language, loaded on first use. Languages without a configured model
+        use the English model.
+    """
+    nlp = _models.get(lang)
+    if nlp is not None:
+        return nlp
+    with _lock:
+        if lang not in _models:
+            name = _model_names.get(lang, _model_names["en"])
+            start = time.time()
+            _models[lang] = spacy.load(name, disable=_disabled)
+            logger.info(f"Loaded spaCy model {name} for {lang} in {time.time() - start:.2f}s")
+        return _models[lang]
+
+
+def loaded_models() -> list[str]:
+    return list(_models.keys())
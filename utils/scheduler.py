@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from aiohttp import ClientConnectionError, ClientResponseError
+
+READ = "read"
+WRITE = "write"
+
+T = TypeVar("T")
+
+
+def is_retryable(ex: Exception) -> bool:
+    if isinstance(ex, ClientResponseError):
+        return ex.status >= 500
+    return isinstance(ex, (asyncio.TimeoutError, ClientConnectionError))
+
+
+class RequestStats:
+    def __init__(self):
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float):
+        self.completed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        return {"queued": self.queued, "in_flight": self.in_flight, "completed": self.completed,
+                "failed": self.failed, "retries": self.retries,
+                "avg_latency": self.total_latency / self.completed if self.completed > 0 else 0.0,
+                "max_latency": self.max_latency}
+
+
+class RequestScheduler:
+    """
+    Limits the number of requests in flight, separately for reads and writes, and retries idempotent requests with
+    jittered exponential backoff on server errors and timeouts. Requests over the limit wait in a queue.
+    """
+
+    def __init__(self, name: str, max_reads: int | None = None, max_writes: int | None = None,
+                 retries: int | None = None, backoff: float = 0.5, max_backoff: float = 30, timeout: float = 60,
+                 retryable: Callable[[Exception], bool] = is_retryable):
+        self.logger = logging.getLogger(name)
+        self.limits = {READ: asyncio.Semaphore(max_reads or 8), WRITE: asyncio.Semaphore(max_writes or 2)}
+        self.stats = {READ: RequestStats(), WRITE: RequestStats()}
+        self.retries = retries if retries is not None else 3
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retryable = retryable
+
+    def get_stats(self):
+        return {kind: stats.as_dict() for kind, stats in self.stats.items()}
+
+    def __get_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @asynccontextmanager
+    async def slot(self, kind: str):
+        """
+        Wait for a free slot of the given kind and hold it for the duration of the context.
+        """
+        stats = self.stats[kind]
+        semaphore = self.limits[kind]
+        stats.queued += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.queued -= 1
+        stats.in_flight += 1
+        try:
+            start = time.monotonic()
+            yield
+            stats.record(time.monotonic() - start)
+        finally:
+            stats.in_flight -= 1
+            semaphore.release()
+
+    async def __run_once(self, kind: str, request: Callable[[], Awaitable[T]]) -> T:
+        async with self.slot(kind):
+            return await asyncio.wait_for(request(), self.timeout)
+
+    async def __retry(self, kind: str, ex: Exception, attempt: int, idempotent: bool = True):
+        if not idempotent or attempt >= self.retries or not self.retryable(ex):
+            self.stats[kind].failed += 1
+            raise ex
+        delay = self.__get_delay(attempt)
+        self.stats[kind].retries += 1
+        self.logger.warning(f"{kind} request failed with {repr(ex)}, retry {attempt + 1} in {delay:.2f}s.")
+        await asyncio.sleep(delay)
+
+    async def run(self, kind: str, request: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+        """
+        Run the request once a slot for its kind is free.
+        :param kind: READ or WRITE
+        :param request: creates the awaitable that executes the request, called once per attempt
+        :param idempotent: only idempotent requests are retried
+        :return: the result of the request
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self.__run_once(kind, request)
+            except Exception as ex:
+                await self.__retry(kind, ex, attempt, idempotent)
+                attempt += 1
+
+    async def stream(self, kind: str, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Iterate a streamed response while holding a slot for its kind. The stream is retried only if it failed before
+        its first item, otherwise the items would be repeated.
+        :param kind: READ or WRITE
+        :param open_stream: creates the async iterator that executes the request, called once per attempt
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.slot(kind):
+                    async for item in open_stream():
+                        started = True
+                        yield item
+                return
+            except Exception as ex:
+                if started:
+                    self.stats[kind].failed += 1
+                    raise
+                await self.__retry(kind, ex, attempt)
+                attempt += 1
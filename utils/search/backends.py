@@ -0,0 +1,46 @@
+import os
+import shutil
+
+from whoosh.fields import Schema
+from whoosh.qparser import AndGroup
+
+from utils.search.fts5 import FTS5SearchIndex
+from utils.search.index import SearchIndex
+from utils.whoosh.index import WhooshSearchIndex
+
+
+def get_search_index_path(backend: str | None, name: str) -> str:
+    """
+    :param backend: whoosh (default) or fts5
+    :param name: name of the index, stored below the index directory
+    """
+    backend = backend or "whoosh"
+    if backend == "whoosh":
+        return f"index/{name}"
+    if backend == "fts5":
+        return f"index/{name}.sqlite"
+    raise Exception(f"Unknown search backend {backend}, use whoosh or fts5.")
+
+
+def create_search_index(backend: str | None, name: str, schema: Schema, fields: list[str],
+                        group=AndGroup) -> SearchIndex:
+    """
+    :param backend: whoosh (default) or fts5
+    :param name: name of the index, stored below the index directory
+    """
+    path = get_search_index_path(backend, name)
+    if backend == "fts5":
+        return FTS5SearchIndex(path, schema, fields, group=group)
+    return WhooshSearchIndex(path, schema, fields, group=group)
+
+
+def remove_search_index(backend: str | None, name: str):
+    """
+    Delete the files of a closed index, missing files are ignored.
+    """
+    path = get_search_index_path(backend, name)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    for file_path in [path, path + "-wal", path + "-shm"]:
+        if os.path.isfile(file_path):
+            os.remove(file_path)
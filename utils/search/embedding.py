@@ -0,0 +1,52 @@
+import numpy as np
+from spacy.language import Language
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def embed(nlp: Language, texts: list[str], batch_size: int = 1000) -> np.ndarray:
+    """
+    Average of the static word vectors of every text. Only the tokenizer runs, the vectors are looked up in the
+    vocabulary of the model.
+    :return: unit length float32 rows, zero rows for texts without known words
+    """
+    if len(texts) == 0:
+        return np.zeros((0, nlp.vocab.vectors_length), dtype=np.float32)
+    vectors = np.array([doc.vector for doc in nlp.tokenizer.pipe(texts, batch_size=batch_size)], dtype=np.float32)
+    return normalize_rows(vectors)
+
+
+class EmbeddingIndex:
+    """
+    Matrix of unit length text embeddings. A batch of queries is scored against all rows with one matrix product,
+    the cosine similarity, and the top k of every query are picked with argpartition.
+    """
+
+    def __init__(self, keys: list, vectors: np.ndarray):
+        self.keys = keys
+        self.matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search_many(self, vectors: np.ndarray, limit: int = 1, threshold: float = 0.0) -> list[list[tuple]]:
+        """
+        :param vectors: unit length query embeddings, one row per query
+        :return: (key, similarity) of the best rows with at least threshold similarity for every query, best first
+        """
+        if len(vectors) == 0:
+            return []
+        if len(self.keys) == 0:
+            return [[] for _ in range(len(vectors))]
+        scores = np.asarray(vectors, dtype=np.float32) @ self.matrix.T
+        limit = min(limit, len(self.keys))
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        results = []
+        for query_scores, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-query_scores[candidates], kind="stable")]
+            results.append([(self.keys[row], float(query_scores[row])) for row in candidates
+                            if query_scores[row] >= threshold])
+        return results
@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from whoosh.fields import Schema
+from whoosh.qparser import AndGroup, OrGroup
+
+from utils.search.index import SearchIndex
+
+
+class FTS5SearchIndex(SearchIndex):
+    """
+    Full text index in an SQLite database with the FTS5 extension. Fields are analyzed in Python with the analyzers of
+    the whoosh schema, the tokens are written space separated into one FTS5 column per searched field, so lemmas and
+    query analysis match the whoosh backend. Results are ranked with bm25, weighted by the field boosts of the schema.
+
+    Stored fields are kept as JSON next to the FTS5 table. A generation counter in the database moves with every
+    write, so several processes can share the index file.
+    """
+
+    def __init__(self, path: str, schema: Schema, fields: list[str], group=AndGroup, check_interval: float = 1.0,
+                 cache_size: int = 4096):
+        super().__init__(path, schema, fields, check_interval=check_interval, cache_size=cache_size)
+        self.operator = " OR " if issubclass(group, OrGroup) else " AND "
+        self.stored_fields = [name for name, field in schema.items() if field.stored]
+        self.weights = [float(schema[field].format.field_boost) for field in fields]
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA busy_timeout=10000")
+        self.columns = ", ".join(f'"{field}"' for field in fields)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS documents "
+                                    "(rowid INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, hash TEXT, stored TEXT)")
+            self.connection.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5({self.columns}, "
+                                    f"tokenize='unicode61 remove_diacritics 0')")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0), ('modified', 0)")
+        self.__generation = 0
+        self._reload()
+        self.cache_generation = self.__generation
+
+    def __get_meta(self, name: str):
+        return self.connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    def last_modified(self) -> float:
+        with self.lock:
+            return self.__get_meta("modified")
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT count(*) FROM documents").fetchone()[0]
+
+    def _reload(self):
+        with self.lock:
+            generation = self.__get_meta("generation")
+            if generation != self.__generation:
+                self.logger.info(f"Index {self.path} changed, generation {generation}.")
+            self.__generation = generation
+
+    def get_stored_documents(self) -> list[dict]:
+        with self.lock:
+            self._refresh_if_stale()
+            return [json.loads(stored) for stored, in self.connection.execute("SELECT stored FROM documents")]
+
+    def _get_hashes(self, key: str, hash_field: str) -> dict[str, str | None]:
+        return dict(self.connection.execute("SELECT key, hash FROM documents"))
+
+    def __analyze(self, field: str, value, mode: str) -> list[str]:
+        if value is None:
+            return []
+        return list(self.schema[field].process_text(value, mode=mode))
+
+    def __get_row(self, document: dict, key: str, hash_field: str) -> tuple:
+        stored = {field: document.get(f"_stored_{field}", document[field]) for field in self.stored_fields
+                  if field in document}
+        texts = [" ".join(self.__analyze(field, document.get(field), "index")) for field in self.fields]
+        return str(document[key]), document.get(hash_field), json.dumps(stored, ensure_ascii=False), texts
+
+    def _write(self, documents: list[dict], deleted_keys: list[str], key: str, hash_field: str = "hash",
+               clear: bool = False):
+        # Analysis is the expensive part, it runs before the write transaction
+        rows = [self.__get_row(document, key, hash_field) for document in documents]
+        placeholders = ", ".join("?" for _ in self.fields)
+        with self.lock, self.connection:
+            if clear:
+                self.connection.execute("DELETE FROM documents")
+                self.connection.execute("DELETE FROM fts")
+            for document_key in [row[0] for row in rows] + list(deleted_keys):
+                indexed = self.connection.execute("SELECT rowid FROM documents WHERE key = ?",
+                                                  (str(document_key),)).fetchone()
+                if indexed is not None:
+                    self.connection.execute("DELETE FROM documents WHERE rowid = ?", indexed)
+                    self.connection.execute("DELETE FROM fts WHERE rowid = ?", indexed)
+            for document_key, document_hash, stored, texts in rows:
+                rowid = self.connection.execute("INSERT INTO documents (key, hash, stored) VALUES (?, ?, ?)",
+                                                (document_key, document_hash, stored)).lastrowid
+                self.connection.execute(f"INSERT INTO fts (rowid, {self.columns}) VALUES (?, {placeholders})",
+                                        (rowid, *texts))
+            self.connection.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            self.connection.execute("UPDATE meta SET value = ? WHERE name = 'modified'", (time.time(),))
+
+    @staticmethod
+    def __quote(token: str) -> str:
+        return '"' + token.replace('"', '""') + '"'
+
+    def get_match(self, text: str) -> str | None:
+        """
+        Build the FTS5 query of the text the way the whoosh MultifieldParser does: every word has to match in one of
+        the fields, analyzed with the analyzer of that field, words are combined with the group of the index.
+        :return: the FTS5 MATCH expression, None if no word has any tokens
+        """
+        words = []
+        for word in text.split():
+            alternatives = []
+            for field in self.fields:
+                tokens = self.__analyze(field, word, "query")
+                if len(tokens) > 0:
+                    alternatives.append(f"{{{field}}} : (" + " AND ".join(map(self.__quote, tokens)) + ")")
+            if len(alternatives) > 0:
+                words.append("(" + " OR ".join(alternatives) + ")")
+        if len(words) == 0:
+            return None
+        return self.operator.join(words)
+
+    def _search(self, texts: list[str], limit: int | None) -> dict[str, list[dict]]:
+        # Building the match expressions analyzes the query text, it runs without holding the lock
+        matches = {text: self.get_match(text) for text in texts}
+        weights = ", ".join(map(str, self.weights))
+        query = (f"SELECT documents.stored FROM fts JOIN documents ON documents.rowid = fts.rowid "
+                 f"WHERE fts MATCH ? ORDER BY bm25(fts, {weights}) LIMIT ?")
+        results = {}
+        with self.lock:
+            for text, match in matches.items():
+                if match is None:
+                    results[text] = []
+                    continue
+                rows = self.connection.execute(query, (match, limit if limit is not None else -1))
+                results[text] = [json.loads(stored) for stored, in rows]
+        return results
+
+    def copy_to(self, path: str):
+        with self.lock:
+            with closing(sqlite3.connect(path)) as target:
+                self.connection.backup(target)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
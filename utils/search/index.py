@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Callable, ContextManager, TypeVar
+
+from whoosh.fields import Schema
+
+T = TypeVar("T")
+
+
+class SearchIndex(metaclass=ABCMeta):
+    """
+    Full text index of documents described by a whoosh Schema, searched over the given fields. Implementations keep
+    a generation that moves with every change of the index, also by other processes, checked at most every
+    check_interval seconds.
+
+    Results of the last cache_size distinct query texts are cached, the cache is cleared when the generation moves.
+    Structures derived from the stored documents, like fuzzy or embedding matchers, are built with get_derived and
+    rebuilt when the generation moves. All methods can be used from concurrent requests.
+    """
+
+    def __init__(self, path: str, schema: Schema, fields: list[str], check_interval: float = 1.0,
+                 cache_size: int = 4096):
+        self.logger = logging.getLogger(type(self).__name__)
+        self.path = path
+        self.schema = schema
+        self.fields = fields
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.last_check = time.monotonic()
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple[str, int | None], list[dict]] = OrderedDict()
+        self.cache_generation = None
+        self.hits = 0
+        self.misses = 0
+        self.derived = {}
+
+    @property
+    @abstractmethod
+    def generation(self) -> int:
+        """
+        :return: generation of the index the searches currently see
+        """
+
+    @abstractmethod
+    def last_modified(self) -> float:
+        """
+        :return: timestamp of the last change of the index
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        :return: number of indexed documents
+        """
+
+    @abstractmethod
+    def _reload(self):
+        """
+        Pick up changes of the index by other writers.
+        """
+
+    @abstractmethod
+    def get_stored_documents(self) -> list[dict]:
+        """
+        :return: stored fields of all documents
+        """
+
+    @abstractmethod
+    def _get_hashes(self, key: str, hash_field: str) -> dict[str, str | None]:
+        """
+        :return: content hash of every indexed document by its key
+        """
+
+    @abstractmethod
+    def _write(self, documents: list[dict], deleted_keys: list[str], key: str, hash_field: str = "hash",
+               clear: bool = False):
+        """
+        Add the documents, replacing indexed documents with the same key, and delete the documents of the deleted
+        keys in one transaction.
+        :param hash_field: field with the content hash of the documents
+        :param clear: delete all indexed documents first
+        """
+
+    @abstractmethod
+    def _search(self, texts: list[str], limit: int | None) -> dict[str, list[dict]]:
+        """
+        :return: stored fields of the best matching documents of every text, best first
+        """
+
+    @abstractmethod
+    def copy_to(self, path: str):
+        """
+        Write a consistent copy of the index to path, which can be opened as an index of the same backend.
+        """
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def refresh(self):
+        """
+        Pick up changes of other writers and drop cached results of older generations.
+        """
+        with self.lock:
+            self._reload()
+            if self.generation != self.cache_generation:
+                self.cache.clear()
+                self.cache_generation = self.generation
+            self.last_check = time.monotonic()
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self.last_check >= self.check_interval:
+            self.refresh()
+
+    def get_stats(self):
+        return {"generation": self.generation, "documents": self.count(), "age": time.time() - self.last_modified(),
+                "cached": len(self.cache), "hits": self.hits, "misses": self.misses}
+
+    def get_derived(self, name: str, build: Callable[[list[dict]], T]) -> T:
+        """
+        :param name: name of the derived structure
+        :param build: builds the structure from all stored documents
+        :return: the structure built from the current generation of the index
+        """
+        with self.lock:
+            self._refresh_if_stale()
+            generation = self.generation
+            derived = self.derived.get(name)
+            if derived is not None and derived[0] == generation:
+                return derived[1]
+            documents = self.get_stored_documents()
+        start = time.time()
+        value = build(documents)
+        self.logger.info(f"Built {name} of index {self.path} from {len(documents)} documents in {time.time() - start}")
+        with self.lock:
+            self.derived[name] = (generation, value)
+        return value
+
+    @staticmethod
+    def get_hash(document: dict) -> str:
+        return hashlib.sha1(json.dumps(document, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def sync(self, documents: dict[str, dict], key: str = "id", hash_field: str = "hash",
+             prepare: Callable[[list[dict]], list[dict]] | None = None):
+        """
+        Make the index contain exactly the given documents. Only documents whose content hash changed are analyzed
+        and written, documents that are not given anymore are deleted. The key field must be unique in the schema and
+        the hash field stored.
+        :param documents: documents keyed by the value of their key field
+        :param prepare: applied to the changed documents before they are written, e.g. to lemmatize them in bulk
+        :return: number of updated and deleted documents
+        """
+        with self.lock:
+            self._refresh_if_stale()
+            indexed = self._get_hashes(key, hash_field)
+        changed = []
+        for document_key, document in documents.items():
+            document_hash = self.get_hash(document)
+            if indexed.get(document_key) != document_hash:
+                changed.append({key: document_key, hash_field: document_hash, **document})
+        if prepare is not None and len(changed) > 0:
+            changed = prepare(changed)
+        deleted = list(indexed.keys() - documents.keys())
+        if len(changed) > 0 or len(deleted) > 0:
+            self._write(changed, deleted, key, hash_field)
+            self.refresh()
+        self.logger.info(f"Synced index {self.path}: {len(changed)} updated, {len(deleted)} deleted, "
+                         f"{len(documents) - len(changed)} unchanged.")
+        return len(changed), len(deleted)
+
+    def replace(self, documents: list[dict], key: str = "id"):
+        """
+        Replace all documents of the index.
+        """
+        self._write(documents, [], key, clear=True)
+        self.refresh()
+        self.logger.info(f"Replaced index {self.path} with {len(documents)} documents.")
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def __get_cached(self, text: str, limit: int | None) -> list[dict] | None:
+        results = self.cache.get((text, limit))
+        if results is None:
+            self.misses += 1
+            return None
+        self.cache.move_to_end((text, limit))
+        self.hits += 1
+        return results
+
+    def __put_cached(self, text: str, limit: int | None, results: list[dict]):
+        self.cache[(text, limit)] = results
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def search(self, text: str, limit: int | None = 1) -> list[dict]:
+        return self.search_many([text], limit=limit)[0]
+
+    def search_many(self, texts: list[str], limit: int | None = 1,
+                    prime: Callable[[list[str]], ContextManager] | None = None) -> list[list[dict]]:
+        """
+        Search all texts, identical texts are searched once and cached results are reused.
+        :param prime: context entered around the search of the texts without cached results, e.g. to lemmatize their
+                      words in bulk
+        :return: results for every text in the order of texts
+        """
+        normalized = {text: self.normalize(text) for text in texts}
+        with self.lock:
+            self._refresh_if_stale()
+            generation = self.generation
+            results = {text: self.__get_cached(text, limit) for text in dict.fromkeys(normalized.values())}
+        missing = [text for text, cached in results.items() if cached is None]
+        if len(missing) > 0:
+            with prime(missing) if prime is not None else nullcontext():
+                results.update(self._search(missing, limit))
+            with self.lock:
+                if self.generation == generation:
+                    for text in missing:
+                        self.__put_cached(text, limit, results[text])
+        return [[dict(result) for result in results[normalized[text]]] for text in texts]
@@ -0,0 +1,93 @@
+import re
+import unicodedata
+
+import numpy as np
+
+NON_WORD = re.compile(r"[\W_]+")
+TRANSLITERATIONS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+
+def normalize(text: str) -> str:
+    """
+    Lower case, German umlauts transliterated, accents and punctuation removed.
+    """
+    text = text.lower().translate(TRANSLITERATIONS)
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def get_grams(text: str, q: int = 3) -> set[str]:
+    """
+    q-grams of every word, words are padded in front only, so truncated words ("kartoff") match the start of the
+    full word ("kartoffeln").
+    """
+    grams = set()
+    for word in normalize(text).split():
+        word = " " * (q - 1) + word
+        grams.update(word[i:i + q] for i in range(len(word) - q + 1))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-memory q-gram index over short texts, e.g. all name variants of the products. A query is scored against every
+    text with the Tversky similarity of their gram sets, grams missing from the text weigh alpha, extra grams of the
+    text weigh beta. The default weights favor texts that contain most of the query, so abbreviated and truncated
+    receipt names match the full product names. Scores are aggregated per key by their maximum.
+    """
+
+    def __init__(self, texts: list[tuple[str, str]], q: int = 3, alpha: float = 1.0, beta: float = 0.2):
+        """
+        :param texts: (key, text) pairs, a key can have many texts
+        """
+        self.q = q
+        self.alpha = alpha
+        self.beta = beta
+        self.keys = list(dict.fromkeys(key for key, _ in texts))
+        key_codes = {key: code for code, key in enumerate(self.keys)}
+        self.texts = [text for _, text in texts]
+        self.text_keys = np.array([key_codes[key] for key, _ in texts], dtype=np.int64)
+        postings = {}
+        sizes = []
+        for text_id, (_, text) in enumerate(texts):
+            grams = get_grams(text, q)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(text_id)
+        self.sizes = np.array(sizes, dtype=np.float64)
+        self.postings = {gram: np.array(text_ids, dtype=np.int64) for gram, text_ids in postings.items()}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def scores(self, text: str) -> np.ndarray:
+        """
+        :return: similarity of the text to every indexed text
+        """
+        grams = get_grams(text, self.q)
+        matches = [self.postings[gram] for gram in grams if gram in self.postings]
+        if len(grams) == 0 or len(matches) == 0:
+            return np.zeros(len(self.texts))
+        shared = np.bincount(np.concatenate(matches), minlength=len(self.texts)).astype(np.float64)
+        return shared / (shared + self.alpha * (len(grams) - shared) + self.beta * (self.sizes - shared))
+
+    def search(self, text: str, limit: int = 1, threshold: float = 0.5) -> list[dict]:
+        """
+        :return: the best scoring keys with a score of at least threshold, best first, with the best matching text
+        """
+        if len(self.texts) == 0:
+            return []
+        scores = self.scores(text)
+        key_scores = np.zeros(len(self.keys))
+        np.maximum.at(key_scores, self.text_keys, scores)
+        candidates = np.flatnonzero(key_scores >= threshold)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-key_scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-key_scores[candidates], kind="stable")]
+        results = []
+        for key_code in candidates:
+            text_ids = np.flatnonzero(self.text_keys == key_code)
+            best_text = text_ids[np.argmax(scores[text_ids])]
+            results.append({"id": self.keys[key_code], "name": self.texts[best_text],
+                            "score": float(key_scores[key_code])})
+        return results
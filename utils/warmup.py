@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+
+class WarmUp:
+    """
+    Runs the startup steps, like refreshing stale indexes, one after another in a background task, so the app serves
+    from the persisted state right away. Failed steps are logged and do not stop the following steps.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("WarmUp")
+        self.steps: dict[str, Callable[[], Awaitable]] = {}
+        self.progress: dict[str, dict] = {}
+        self.task = None
+
+    def add(self, name: str, step: Callable[[], Awaitable]):
+        self.steps[name] = step
+        self.progress[name] = {"status": "pending"}
+
+    async def run(self):
+        self.task = asyncio.create_task(self.__run_steps())
+
+    async def __run_steps(self):
+        start = time.time()
+        for name, step in self.steps.items():
+            self.progress[name] = {"status": "running", "started": time.time()}
+            try:
+                await step()
+                self.progress[name].update(status="done", finished=time.time())
+            except Exception as e:
+                self.logger.exception(f"Warm-up step {name} failed.")
+                self.progress[name].update(status="failed", finished=time.time(), error=str(e))
+        self.logger.info(f"Warm-up finished in {time.time() - start}")
+
+    @property
+    def finished(self) -> bool:
+        return all(step["status"] in ["done", "failed"] for step in self.progress.values())
+
+    def get_progress(self) -> dict:
+        finished = sum(step["status"] in ["done", "failed"] for step in self.progress.values())
+        return {"finished": self.finished, "done": finished, "total": len(self.progress), "steps": self.progress}
+
+    async def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
@@ -1,15 +1,23 @@
-import spacy
 from whoosh.analysis import Filter
 
+from utils.nlp import get_nlp
+
 
 class LemmatizationFilter(Filter):
     def __init__(self, lang='en'):
-        if lang == 'de':
-            self.nlp = spacy.load('de_core_news_md')
-        else:
-            self.nlp = spacy.load('en_core_web_sm')
+        self.lang = lang
         self.cache = {}
 
+    def __getstate__(self):
+        return {"lang": self.lang}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def nlp(self):
+        return get_nlp(self.lang)
+
     def __call__(self, tokens):
         for tok in tokens:
             if tok.text in self.cache:
@@ -19,4 +27,4 @@ class LemmatizationFilter(Filter):
             for doc_token in doc:
                 tok.text = doc_token.lemma_
                 self.cache[tok.text] = tok
-                yield tok
\ No newline at end of file
+                yield tok
@@ -0,0 +1,88 @@
+import os
+import shutil
+
+from whoosh import writing
+from whoosh.fields import Schema
+from whoosh.index import create_in, open_dir, exists_in
+from whoosh.qparser import MultifieldParser, AndGroup
+from whoosh.query import Query
+
+from utils.search.index import SearchIndex
+
+
+class WhooshSearchIndex(SearchIndex):
+    """
+    Whoosh index with one long-lived searcher and query parser shared by all queries. The searcher is refreshed after
+    every write through this object and, for commits from other writers, when the index generation moved. Searches
+    hold a lock, so the index can be used from concurrent requests.
+    """
+
+    def __init__(self, path: str, schema: Schema, fields: list[str], group=AndGroup, check_interval: float = 1.0,
+                 cache_size: int = 4096):
+        os.makedirs(path, exist_ok=True)
+        if exists_in(path):
+            self.ix = open_dir(path, schema=schema)
+        else:
+            self.ix = create_in(path, schema=schema)
+        super().__init__(path, self.ix.schema, fields, check_interval=check_interval, cache_size=cache_size)
+        self.parser = MultifieldParser(fields, self.schema, group=group)
+        self.searcher = self.ix.searcher()
+        self.cache_generation = self.generation
+
+    @property
+    def generation(self) -> int:
+        return self.searcher.reader().generation()
+
+    def last_modified(self) -> float:
+        return self.ix.last_modified()
+
+    def count(self) -> int:
+        with self.lock:
+            return self.searcher.doc_count()
+
+    def _reload(self):
+        if not self.searcher.up_to_date():
+            self.logger.info(f"Index {self.path} changed, refreshing searcher.")
+        self.searcher = self.searcher.refresh()
+
+    def get_stored_documents(self) -> list[dict]:
+        with self.lock:
+            self._refresh_if_stale()
+            return list(self.searcher.all_stored_fields())
+
+    def _get_hashes(self, key: str, hash_field: str) -> dict[str, str | None]:
+        return {fields[key]: fields.get(hash_field) for fields in self.searcher.all_stored_fields()}
+
+    def _write(self, documents: list[dict], deleted_keys: list[str], key: str, hash_field: str = "hash",
+               clear: bool = False):
+        writer = self.ix.writer()
+        for document in documents:
+            if clear:
+                writer.add_document(**document)
+            else:
+                writer.update_document(**document)
+        for document_key in deleted_keys:
+            writer.delete_by_term(key, document_key)
+        if clear:
+            writer.commit(mergetype=writing.CLEAR)
+        else:
+            writer.commit()
+
+    def parse(self, text: str) -> Query:
+        return self.parser.parse(text)
+
+    def _search(self, texts: list[str], limit: int | None) -> dict[str, list[dict]]:
+        # Parsing analyzes the query text, it runs without holding the lock
+        queries = {text: self.parse(text) for text in texts}
+        with self.lock:
+            return {text: [dict(result) for result in self.searcher.search(query, limit=limit)]
+                    for text, query in queries.items()}
+
+    def copy_to(self, path: str):
+        # Commits replace the TOC and segment files, the copy is taken without a write of this object in progress
+        with self.lock:
+            shutil.copytree(self.path, path)
+
+    def close(self):
+        with self.lock:
+            self.searcher.close()
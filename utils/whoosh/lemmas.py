@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import threading
+
+
+class LemmaTable:
+    """
+    Word to lemmas table of a language, built from all tokens seen while indexing and persisted as JSON, so query
+    terms can be lemmatized with dict lookups instead of spaCy. Words that were not indexed are lemmatized by spaCy
+    and added as fallback entries, at most max_fallback of them are kept, the oldest are dropped first.
+
+    Use LemmaTable.get to share one table per file.
+    """
+
+    tables: dict[str, "LemmaTable"] = {}
+    tables_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path: str) -> "LemmaTable":
+        table = cls.tables.get(path)
+        if table is None:
+            with cls.tables_lock:
+                if path not in cls.tables:
+                    cls.tables[path] = cls(path)
+                table = cls.tables[path]
+        return table
+
+    def __init__(self, path: str, max_fallback: int = 10000):
+        self.logger = logging.getLogger("LemmaTable")
+        self.path = path
+        self.max_fallback = max_fallback
+        self.lock = threading.Lock()
+        self.indexed: dict[str, list[str]] = {}
+        self.fallback: dict[str, list[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.__load()
+
+    def __getstate__(self):
+        # Tokenizers are pickled with the whoosh schema, the table itself is loaded from its file
+        return {"path": self.path, "max_fallback": self.max_fallback}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __read(self):
+        if not os.path.exists(self.path):
+            return {}, {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+            return data.get("indexed", {}), data.get("fallback", {})
+        except ValueError as ex:
+            self.logger.warning(f"Ignoring broken lemma table {self.path}: {ex}")
+            return {}, {}
+
+    def __load(self):
+        self.indexed, self.fallback = self.__read()
+
+    def __len__(self):
+        return len(self.indexed) + len(self.fallback)
+
+    def record(self, word: str, lemmas: list[str]):
+        """
+        Add the lemmas of an indexed word.
+        """
+        with self.lock:
+            self.indexed[word] = lemmas
+
+    def add_fallback(self, word: str, lemmas: list[str]):
+        """
+        Add the lemmas of a word that spaCy lemmatized at query time.
+        """
+        with self.lock:
+            if word in self.indexed:
+                return
+            self.fallback[word] = lemmas
+            while len(self.fallback) > self.max_fallback:
+                del self.fallback[next(iter(self.fallback))]
+
+    def lookup(self, text: str) -> list[str] | None:
+        """
+        :return: lemmas of all whitespace separated words of the text, None if any word is unknown
+        """
+        lemmas = []
+        with self.lock:
+            for word in text.split():
+                word_lemmas = self.indexed.get(word)
+                if word_lemmas is None:
+                    word_lemmas = self.fallback.get(word)
+                if word_lemmas is None:
+                    self.misses += 1
+                    return None
+                lemmas.extend(word_lemmas)
+            self.hits += 1
+        return lemmas
+
+    def is_known(self, text: str) -> bool:
+        """
+        :return: whether lookup finds all words of the text, without counting a hit or miss
+        """
+        with self.lock:
+            return all(word in self.indexed or word in self.fallback for word in text.split())
+
+    def save(self):
+        """
+        Write the table, entries that another process saved meanwhile are kept. Holds the lock, so words recorded by
+        other threads while saving are not lost.
+        """
+        with self.lock:
+            indexed, fallback = self.__read()
+            indexed.update(self.indexed)
+            fallback.update(self.fallback)
+            fallback = {word: lemmas for word, lemmas in fallback.items() if word not in indexed}
+            fallback = dict(list(fallback.items())[-self.max_fallback:])
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump({"indexed": indexed, "fallback": fallback}, fp, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.indexed, self.fallback = indexed, fallback
+        self.logger.info(f"Saved {len(indexed)} indexed and {len(fallback)} fallback lemmas to {self.path}")
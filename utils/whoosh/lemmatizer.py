@@ -0,0 +1,78 @@
+import logging
+import time
+
+from utils.whoosh.tokenizers import LemmaTokenizer, get_lemmas
+
+
+class LemmatizerStats:
+    def __init__(self):
+        self.texts = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def record(self, texts: int, tokens: int, seconds: float):
+        self.texts += texts
+        self.tokens += tokens
+        self.seconds += seconds
+
+    def as_dict(self):
+        return {"texts": self.texts, "tokens": self.tokens, "seconds": self.seconds,
+                "tokens_per_second": self.tokens / self.seconds if self.seconds > 0 else 0.0}
+
+
+class BulkLemmatizer:
+    """
+    Lemmatizes many texts with the model of a LemmaTokenizer in batches through nlp.pipe, identical texts are
+    lemmatized once. The lemmas can be indexed directly by fields that use the same LemmaTokenizer. All lemmatized
+    words are added to the lemma table of the tokenizer, which is used to lemmatize queries.
+    """
+
+    def __init__(self, tokenizer: LemmaTokenizer, batch_size: int = 256, n_process: int | None = None):
+        self.logger = logging.getLogger("BulkLemmatizer")
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.n_process = n_process or 1
+        self.stats = LemmatizerStats()
+
+    def lemmatize(self, texts: list[str]) -> dict[str, list[str]]:
+        """
+        :return: lemmas of every distinct text
+        """
+        start = time.perf_counter()
+        texts = list(dict.fromkeys(texts))
+        docs = self.tokenizer.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+        lemmas = {}
+        for text, doc in zip(texts, docs):
+            self.tokenizer.record(doc)
+            lemmas[text] = get_lemmas(doc)
+        seconds = time.perf_counter() - start
+        tokens = sum(len(text_lemmas) for text_lemmas in lemmas.values())
+        self.stats.record(len(texts), tokens, seconds)
+        self.logger.info(f"Lemmatized {len(texts)} texts with {tokens} tokens in {seconds:.2f}s "
+                         f"({tokens / seconds if seconds > 0 else 0.0:.0f} tokens/s)")
+        if len(texts) > 0:
+            self.tokenizer.lemma_table.save()
+        return lemmas
+
+
+def lemmatize_documents(documents: list[dict], lemmatizers: dict[str, BulkLemmatizer]) -> list[dict]:
+    """
+    Replace the text of the given fields with their lemmas and keep the original text as the stored value. Fields
+    with the same lemmatizer are lemmatized in one pass.
+    :param documents: whoosh documents
+    :param lemmatizers: lemmatizer of every field to lemmatize
+    :return: the documents
+    """
+    by_lemmatizer = {}
+    for field, lemmatizer in lemmatizers.items():
+        by_lemmatizer.setdefault(id(lemmatizer), (lemmatizer, []))[1].append(field)
+    for lemmatizer, fields in by_lemmatizer.values():
+        texts = [document[field] for document in documents for field in fields
+                 if isinstance(document.get(field), str)]
+        lemmas = lemmatizer.lemmatize(texts)
+        for document in documents:
+            for field in fields:
+                if isinstance(document.get(field), str):
+                    document[f"_stored_{field}"] = document[field]
+                    document[field] = lemmas[document[field]]
+    return documents
@@ -1,23 +1,95 @@
-import spacy
+from contextlib import contextmanager
+
 from whoosh.analysis import Tokenizer, Token
 
+from utils.nlp import get_nlp
+from utils.whoosh.lemmas import LemmaTable
+
+
+def get_token_lemmas(spacy_token) -> list[str]:
+    if spacy_token.is_punct or spacy_token.is_stop or spacy_token.is_digit:
+        return []
+    word = str(spacy_token.lemma_.lower())
+    if len(word) < 2:
+        return []
+    return [word]
+
+
+def get_lemmas(doc) -> list[str]:
+    return [lemma for spacy_token in doc for lemma in get_token_lemmas(spacy_token)]
+
 
 class LemmaTokenizer(Tokenizer):
+    """
+    Lemmatizes text with spaCy. Values that are already lists of lemmas, e.g. from a BulkLemmatizer, are indexed as
+    they are. Queries are lemmatized with the LemmaTable of the language (index/lemmas_<lang>.json), spaCy is only
+    used for queries with unknown words, which are added to the table as fallback entries.
+
+    The spaCy model and the lemma table are shared by all tokenizers of a language and loaded on first use. Only the
+    language is pickled with the whoosh schema.
+    """
+
     def __init__(self, lang='en'):
-        if lang == 'de':
-            self.nlp = spacy.load('de_core_news_md')
-        else:
-            self.nlp = spacy.load('en_core_web_sm')
+        self.lang = lang
+        self.docs = {}
+
+    def __getstate__(self):
+        return {"lang": self.lang}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def nlp(self):
+        return get_nlp(self.lang)
+
+    @property
+    def lemma_table(self) -> LemmaTable:
+        return LemmaTable.get(f"index/lemmas_{self.lang}.json")
+
+    @contextmanager
+    def primed(self, texts):
+        """
+        Lemmatize the texts that the lemma table does not know in one nlp.pipe pass and use the results while the
+        context is active, instead of calling the model once per text.
+        """
+        texts = [text for text in dict.fromkeys(texts) if text not in self.docs and not self.lemma_table.is_known(text)]
+        if len(texts) > 0:
+            self.docs.update(zip(texts, self.nlp.pipe(texts)))
+        try:
+            yield self
+        finally:
+            for text in texts:
+                self.docs.pop(text, None)
+
+    def record(self, doc):
+        """
+        Add the words of an indexed document to the lemma table.
+        """
+        for spacy_token in doc:
+            self.lemma_table.record(spacy_token.text, get_token_lemmas(spacy_token))
+
+    def __add_fallback(self, value: str, doc, lemmas: list[str]):
+        for spacy_token in doc:
+            self.lemma_table.add_fallback(spacy_token.text, get_token_lemmas(spacy_token))
+        if len(value.split()) == 1:
+            self.lemma_table.add_fallback(value.strip(), lemmas)
 
     def __call__(self, value, positions=False, chars=False, keeporiginal=False, removestops=True, start_pos=0,
                  start_char=0, tokenize=True, mode='', **kwargs):
         t = Token(positions, chars, removestops=removestops, mode=mode, **kwargs)
-        for pos, spacy_token in enumerate(self.nlp(value)):
-            if spacy_token.is_punct or spacy_token.is_stop or spacy_token.is_digit:
-                continue
-            word = str(spacy_token.lemma_.lower())
-            if len(word) < 2:
-                continue
+        if isinstance(value, (list, tuple)):
+            lemmas = value
+        else:
+            lemmas = self.lemma_table.lookup(value) if mode == 'query' else None
+            if lemmas is None:
+                doc = self.docs.get(value)
+                if doc is None:
+                    doc = self.nlp(value)
+                lemmas = get_lemmas(doc)
+                if mode == 'query':
+                    self.__add_fallback(value, doc, lemmas)
+        for pos, word in enumerate(lemmas):
             t.text = word
             t.boost = 1.0
             if keeporiginal:
@@ -25,7 +97,4 @@ class LemmaTokenizer(Tokenizer):
             t.stopped = False
             if positions:
                 t.pos = start_pos + pos
-            if chars:
-                t.startchar = start_char + word.start()
-                t.endchar = start_char + word.end()
             yield t
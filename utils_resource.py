@@ -1,9 +1,15 @@
+import time
+
 from dependency_injector.wiring import inject, Provide, Container
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
 from containers import Container
+from grocy.api.grocy_api import GrocyAPI
 from grocy.index import GrocyIndex
+from offers.index import OfferIndex
+from offers.markt_guru import MarktGuruOffersService
 from stock.forecast.consumption.sarimax import SARIMAXConsumptionForecaster
+from utils.warmup import WarmUp
 
 router = APIRouter()
 
@@ -17,3 +23,36 @@ async def update_indices(grocy_index: GrocyIndex = Depends(Provide[Container.gro
     await grocy_index.update_qu_index()
     await forecaster.create_models()
     return
+
+
+@router.get("/grocy_stats")
+@inject
+async def grocy_stats(grocy_api: GrocyAPI = Depends(Provide[Container.grocy_api])) -> dict:
+    return grocy_api.get_stats()
+
+
+@router.get("/index_stats")
+@inject
+async def index_stats(grocy_index: GrocyIndex = Depends(Provide[Container.grocy_index]),
+                      offer_index: OfferIndex = Depends(Provide[Container.offer_index]),
+                      markt_guru_service: MarktGuruOffersService = Depends(Provide[Container.markt_guru_service])
+                      ) -> dict:
+    return {"grocy": grocy_index.get_stats(), "offers": offer_index.get_stats(),
+            "offer_refresh": markt_guru_service.get_stats()}
+
+
+@router.get("/ready")
+@inject
+async def ready(response: Response, warm_up: WarmUp = Depends(Provide[Container.warm_up]),
+                grocy_index: GrocyIndex = Depends(Provide[Container.grocy_index]),
+                offer_index: OfferIndex = Depends(Provide[Container.offer_index])) -> dict:
+    """
+    Ready as soon as every index has documents, older generations are served while the warm-up refreshes them.
+    """
+    indexes = {"products": grocy_index.product_index, "qus": grocy_index.qu_index, "offers": offer_index.offer_index}
+    indexes = {name: {"generation": index.generation, "documents": index.count(),
+                      "age": time.time() - index.last_modified()} for name, index in indexes.items()}
+    is_ready = all(index["documents"] > 0 for index in indexes.values())
+    if not is_ready:
+        response.status_code = 503
+    return {"ready": is_ready, "indexes": indexes, "warm_up": warm_up.get_progress()}